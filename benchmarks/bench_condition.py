@@ -0,0 +1,59 @@
+"""Micro-benchmark of format_condition.
+
+Compares the precomputed index against the linear scan over CONDITIONS_MAP it
+replaced. Run from the repository root:
+
+    python benchmarks/bench_condition.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from custom_components.heweather.const import CONDITIONS_MAP  # noqa: E402
+from custom_components.heweather.heweather import format_condition  # noqa: E402
+
+# 一次24小时预报刷新的天气文本/图标
+SAMPLES = [
+    ("Sunny", "100"),
+    ("Clear", "150"),
+    ("Overcast", "104"),
+    ("Light Rain", "305"),
+    ("Heavy snow to snowstorm", "410"),
+    ("Severe haze", "513"),
+    ("Unknown", "999"),
+    ("Unmapped", None),
+] * 3
+NUMBER = 20000
+
+
+def linear_scan(condition: str) -> str:
+    """Former implementation of format_condition."""
+    for key, value in CONDITIONS_MAP.items():
+        if condition in value:
+            return key
+    return condition
+
+
+def main() -> None:
+    """Run the benchmark."""
+    results = {
+        "linear scan": timeit.timeit(
+            lambda: [linear_scan(text) for text, _ in SAMPLES], number=NUMBER
+        ),
+        "text index": timeit.timeit(
+            lambda: [format_condition(text) for text, _ in SAMPLES], number=NUMBER
+        ),
+        "icon index": timeit.timeit(
+            lambda: [format_condition(text, icon) for text, icon in SAMPLES], number=NUMBER
+        ),
+    }
+    baseline = results["linear scan"]
+    for name, elapsed in results.items():
+        per_row = elapsed / NUMBER / len(SAMPLES) * 1e9
+        print(f"{name:12} {per_row:8.1f} ns/row  x{baseline / elapsed:.1f}")
+
+
+if __name__ == "__main__":
+    main()
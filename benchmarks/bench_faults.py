@@ -0,0 +1,187 @@
+"""Fault-injection checks of the request pipeline against the local QWeather stand-in.
+
+Scenarios, each with a fresh fetcher:
+
+    flaky     30% of responses are HTTP 503; retries should recover nearly all
+    timeouts  20% of requests never answer; refreshes stay within TIMEOUT
+    tail      4% of responses are slow; hedged requests cut the refresh p95
+    outage    every request fails; the circuit breaker stops the request storm
+    keys      one key of a pool of two is exhausted (402); requests fail over
+
+Every scenario prints its metrics and the run exits non-zero when one of the
+expectations does not hold. Run from the repository root:
+
+    python benchmarks/bench_faults.py --json faults.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from custom_components.heweather import heweather  # noqa: E402
+from custom_components.heweather.const import (  # noqa: E402
+    HEWEATHER_AQI,
+    HEWEATHER_FORECAST,
+    HEWEATHER_TEMPERATURE,
+)
+from custom_components.heweather.heweather import HeWeatherFetcher  # noqa: E402
+
+from bench_refresh import API_KEY, make_entries, use_server  # noqa: E402
+from fake_qweather import FakeQWeather  # noqa: E402
+
+
+def complete(entries) -> float:
+    """Return the fraction of entries holding every kind of data."""
+    keys = (HEWEATHER_TEMPERATURE, HEWEATHER_FORECAST, HEWEATHER_AQI)
+    return sum(all(key in weather.weather_data for key in keys) for weather in entries) / len(entries)
+
+
+async def timed_rounds(weather, fetcher: HeWeatherFetcher, rounds: int) -> list[float]:
+    """Refresh weather rounds times without the cache, return sorted durations."""
+    samples = []
+    for _ in range(rounds):
+        fetcher.cache.clear()
+        start = time.perf_counter()
+        await weather.async_fetch_data()
+        samples.append(time.perf_counter() - start)
+    return sorted(samples)
+
+
+async def start_server(args, **server_args) -> FakeQWeather:
+    """Start a stand-in server and point the integration at it."""
+    server = FakeQWeather(latency=args.latency, fresh=True, **server_args)
+    await server.start()
+    use_server(server)
+    return server
+
+
+async def bench_flaky(session, args, checks: dict) -> dict:
+    server = await start_server(args, error_rate=0.3, error_mode="http")
+    try:
+        entries = make_entries(HeWeatherFetcher(session), args.entries, args.forecast)
+        await asyncio.gather(*(weather.async_fetch_data() for weather in entries))
+    finally:
+        await server.stop()
+    ratio = complete(entries)
+    checks["flaky entries complete >= 0.8"] = ratio >= 0.8
+    return {"flaky_complete": ratio, "flaky_requests": server.requests}
+
+
+async def bench_timeouts(session, args, checks: dict) -> dict:
+    server = await start_server(args, error_rate=0.2, error_mode="timeout")
+    try:
+        entries = make_entries(HeWeatherFetcher(session), args.entries, args.forecast)
+        samples = []
+
+        async def refresh(weather):
+            start = time.perf_counter()
+            await weather.async_fetch_data()
+            samples.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(refresh(weather) for weather in entries))
+    finally:
+        await server.stop()
+    ratio = complete(entries)
+    worst = max(samples)
+    checks["timeouts entries complete >= 0.8"] = ratio >= 0.8
+    # 排队及重试均计入请求的总时长,余量仅留给解析及调度
+    checks["timeouts refresh within 2 * TIMEOUT"] = worst < 2 * heweather.TIMEOUT
+    return {"timeouts_complete": ratio, "timeouts_max": worst}
+
+
+async def bench_tail(session, args, checks: dict) -> dict:
+    result = {}
+    for hedge in (False, True):
+        server = await start_server(args, error_rate=0.04, error_mode="slow", slow_latency=args.slow)
+        try:
+            fetcher = HeWeatherFetcher(session, hedge=hedge)
+            weather, = make_entries(fetcher, 1, args.forecast)
+            # 先积累耗时样本,对冲延迟取各接口的p95
+            await timed_rounds(weather, fetcher, heweather.HEDGE_MIN_SAMPLES)
+            samples = await timed_rounds(weather, fetcher, args.rounds)
+        finally:
+            await server.stop()
+        name = "tail_hedged_p95" if hedge else "tail_p95"
+        result[name] = samples[int(len(samples) * 0.95) - 1]
+    checks["tail hedged p95 < unhedged p95"] = result["tail_hedged_p95"] < result["tail_p95"]
+    return result
+
+
+async def bench_outage(session, args, checks: dict) -> dict:
+    server = await start_server(args, error_rate=1.0, error_mode="http")
+    try:
+        entries = make_entries(HeWeatherFetcher(session), args.entries, args.forecast)
+        start = time.perf_counter()
+        await asyncio.gather(*(weather.async_fetch_data() for weather in entries))
+        wall = time.perf_counter() - start
+    finally:
+        await server.stop()
+    # 无熔断时每个请求都会连同重试发出 1 + RETRIES 次
+    unguarded = args.entries * 3 * (1 + heweather.RETRIES)
+    checks["outage requests < one per endpoint"] = server.requests < args.entries * 3
+    return {"outage_requests": server.requests, "outage_unguarded": unguarded, "outage_wall": wall}
+
+
+async def bench_keys(session, args, checks: dict) -> dict:
+    server = await start_server(args, rejected_keys={API_KEY: "402"})
+    try:
+        fetcher = HeWeatherFetcher(session)
+        fetcher.add_keys([API_KEY, "spare"])
+        entries = make_entries(fetcher, args.entries, args.forecast)
+        await asyncio.gather(*(weather.async_fetch_data() for weather in entries))
+    finally:
+        await server.stop()
+    ratio = complete(entries)
+    checks["keys entries complete"] = ratio == 1.0
+    # 暂停使用前,只有已在进行中的请求会用到被拒绝的KEY
+    checks["keys rejected key ejected"] = server.rejected <= heweather.MAX_CONCURRENT_REQUESTS
+    return {"keys_complete": ratio, "keys_rejected": server.rejected}
+
+
+async def run(args) -> tuple[dict, dict]:
+    # 缩短超时,使场景在数秒内完成
+    heweather.TIMEOUT = args.timeout
+    heweather.ATTEMPT_TIMEOUT = args.timeout / 4
+    heweather.ATTEMPT_MIN_TIMEOUT = args.timeout / 10
+    result: dict = {}
+    checks: dict = {}
+    async with aiohttp.ClientSession() as session:
+        for bench in (bench_flaky, bench_timeouts, bench_tail, bench_outage, bench_keys):
+            result.update(await bench(session, args, checks))
+    return result, checks
+
+
+def main() -> None:
+    """Run the scenarios."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=100)
+    parser.add_argument("--forecast", type=int, default=1, help="1 for 24h, 72/168 for hours, otherwise days")
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--slow", type=float, default=1.0, help="latency of slow responses in the tail scenario")
+    parser.add_argument("--timeout", type=float, default=2.0, help="overall request budget (TIMEOUT)")
+    parser.add_argument("--json", help="write the result to this file")
+    args = parser.parse_args()
+
+    result, checks = asyncio.run(run(args))
+    for name, value in result.items():
+        print(f"{name:20} {value:.6g}")
+    for name, ok in checks.items():
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(result, file, indent=2)
+    if not all(checks.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Forecast decoding benchmarks on large payloads.
+
+Compares decoding a forecast payload into a dict tree and converting it
+afterwards with decoding it row by row through the ForecastRow object hooks:
+
+    {mode}_time       best time to decode and convert one payload (seconds)
+    {mode}_peak       peak memory allocated while doing so (bytes)
+    {mode}_retained   memory still held by the decoded payload (bytes)
+
+for mode in dict_hourly, hook_hourly, dict_daily and hook_daily. Run from the
+repository root:
+
+    python benchmarks/bench_parse.py --hours 168 --days 30
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from custom_components.heweather.heweather import ForecastRow  # noqa: E402
+
+from fake_qweather import hourly_payload, daily_payload  # noqa: E402
+
+UPDATE_TIME = "2022-01-01T00:00+08:00"
+
+
+def measure(body: bytes, key: str, convert, object_hook=None, rounds: int = 200) -> tuple[float, int, int]:
+    """Return best time, peak and retained bytes of decoding body."""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        data = json.loads(body, object_hook=object_hook)
+        tuple(convert(row) for row in data[key])
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    data = json.loads(body, object_hook=object_hook)
+    rows = tuple(convert(row) for row in data[key])
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data, rows
+    return best, peak, retained
+
+
+def main() -> None:
+    """Run the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hours", type=int, default=168)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--json", help="write the result to this file")
+    args = parser.parse_args()
+
+    hourly = json.dumps(hourly_payload(UPDATE_TIME, args.hours)).encode()
+    daily = json.dumps(daily_payload(UPDATE_TIME, args.days)).encode()
+    cases = (
+        ("dict_hourly", hourly, "hourly", ForecastRow.from_hourly, None),
+        ("hook_hourly", hourly, "hourly", ForecastRow.from_hourly, ForecastRow.decode_hourly),
+        ("dict_daily", daily, "daily", ForecastRow.from_daily, None),
+        ("hook_daily", daily, "daily", ForecastRow.from_daily, ForecastRow.decode_daily),
+    )
+    result = {}
+    for mode, body, key, convert, object_hook in cases:
+        best, peak, retained = measure(body, key, convert, object_hook, args.rounds)
+        result[f"{mode}_time"] = best
+        result[f"{mode}_peak"] = peak
+        result[f"{mode}_retained"] = retained
+    for name, value in result.items():
+        print(f"{name:22} {value:.6g}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(result, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
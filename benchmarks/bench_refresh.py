@@ -0,0 +1,182 @@
+"""Refresh benchmarks against the local QWeather stand-in.
+
+Measures, without network access:
+
+    refresh_p50/p95   latency of one HeWeather.async_fetch_data
+    fleet_wall        wall time to refresh N entries at once
+    fleet_coalesced   wall time to refresh N entries sharing one location
+    refresh_peak      peak memory allocated by one refresh (bytes)
+    refresh_blocks    memory blocks still held after one refresh
+    startup_cold      time to bring up N entries from the network
+    startup_warm      time to bring up N entries from the response cache
+
+All metrics are lower-is-better. Run from the repository root:
+
+    python benchmarks/bench_refresh.py --entries 50 --latency 0.05 --json result.json
+    python benchmarks/bench_refresh.py --compare result.json
+
+With --compare the run exits non-zero when a metric regresses by more than
+--tolerance against the saved result.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import aiohttp
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from custom_components.heweather import heweather  # noqa: E402
+from custom_components.heweather.heweather import HeWeather, HeWeatherFetcher  # noqa: E402
+
+from fake_qweather import FakeQWeather  # noqa: E402
+
+API_KEY = "benchmark"
+
+
+def use_server(server: FakeQWeather) -> None:
+    """Point the integration at the local server, disable response caching and rate limiting."""
+    heweather.DEFAULT_LOCATION_API_URL = server.geo_url
+    heweather.DEFAULT_WEATHER_API_URL = server.weather_url
+    heweather.DEFAULT_AIRQUALITY_API_URL = server.air_url
+    heweather.DEFAULT_MINUTELY_API_URL = server.minutely_url
+    heweather.DEFAULT_WARNING_API_URL = server.warning_url
+    heweather.FORECAST_TTL = 0
+    heweather.AIR_TTL = 0
+    # 所有条目共用一个KEY,按默认限速时测得的只是令牌桶的等待时间
+    heweather.RATE_LIMIT = 1e9
+    heweather.RATE_BURST = 1e9
+
+
+def make_entries(fetcher: HeWeatherFetcher, count: int, forecast: int, shared: bool = False) -> list[HeWeather]:
+    """Create count HeWeather clients, for distinct locations unless shared."""
+    return [
+        HeWeather(fetcher, "101010100" if shared else str(101010100 + index), API_KEY, forecast, 0)
+        for index in range(count)
+    ]
+
+
+async def bench_refresh(session, args) -> dict:
+    fetcher = HeWeatherFetcher(session)
+    weather, = make_entries(fetcher, 1, args.forecast)
+    samples = []
+    for _ in range(args.rounds):
+        fetcher.cache.clear()
+        start = time.perf_counter()
+        await weather.async_fetch_data()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "refresh_p50": statistics.median(samples),
+        "refresh_p95": samples[int(len(samples) * 0.95) - 1],
+    }
+
+
+async def bench_fleet(session, args, server: FakeQWeather) -> dict:
+    result = {}
+    for name, shared in (("fleet_wall", False), ("fleet_coalesced", True)):
+        fetcher = HeWeatherFetcher(session)
+        entries = make_entries(fetcher, args.entries, args.forecast, shared)
+        served = server.requests
+        start = time.perf_counter()
+        await asyncio.gather(*(weather.async_fetch_data() for weather in entries))
+        result[name] = time.perf_counter() - start
+        print(f"{name}: {args.entries} entries, {server.requests - served} requests served")
+    return result
+
+
+async def bench_allocations(session, args) -> dict:
+    fetcher = HeWeatherFetcher(session)
+    weather, = make_entries(fetcher, 1, args.forecast)
+    # 预热连接池,只统计刷新本身的分配
+    await weather.async_fetch_data()
+    fetcher.cache.clear()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    await weather.async_fetch_data()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    return {"refresh_peak": peak, "refresh_blocks": blocks}
+
+
+async def bench_startup(session, args) -> dict:
+    fetcher = HeWeatherFetcher(session)
+    entries = make_entries(fetcher, args.entries, args.forecast)
+    start = time.perf_counter()
+    await asyncio.gather(*(weather.async_fetch_data() for weather in entries))
+    cold = time.perf_counter() - start
+
+    # 新的客户端从已有缓存启动,与HA重启后的warm start相同
+    entries = make_entries(fetcher, args.entries, args.forecast)
+    start = time.perf_counter()
+    await asyncio.gather(*(weather.async_fetch_data(cache_only=True) for weather in entries))
+    warm = time.perf_counter() - start
+    return {"startup_cold": cold, "startup_warm": warm}
+
+
+async def run(args) -> dict:
+    server = FakeQWeather(latency=args.latency, error_rate=args.error_rate, fresh=True)
+    await server.start()
+    use_server(server)
+    result = {}
+    try:
+        async with aiohttp.ClientSession() as session:
+            result.update(await bench_refresh(session, args))
+            result.update(await bench_fleet(session, args, server))
+            result.update(await bench_allocations(session, args))
+            result.update(await bench_startup(session, args))
+    finally:
+        await server.stop()
+    return result
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> bool:
+    """Print regressions against baseline, return True when there are none."""
+    ok = True
+    for name, value in result.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if value > previous * (1 + tolerance):
+            print(f"REGRESSION {name}: {previous:.6g} -> {value:.6g}")
+            ok = False
+    return ok
+
+
+def main() -> None:
+    """Run the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--forecast", type=int, default=1, help="1 for 24h, 72/168 for hours, otherwise days")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--json", help="write the result to this file")
+    parser.add_argument("--compare", help="compare with a result written by --json")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    for name, value in result.items():
+        print(f"{name:16} {value:.6g}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(result, file, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if not compare(result, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""Local stand-in for the QWeather geoapi/devapi endpoints.
+
+Serves canned now, hourly, daily, minutely/5m, warning/now, air/now and city/lookup payloads with
+configurable latency and error injection, so benchmarks run without network
+access or API quota.
+"""
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+import random
+
+from aiohttp import web
+
+TZ = timezone(timedelta(hours=8))
+
+
+def _timestamp(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%dT%H:%M+08:00")
+
+
+def now_payload(update_time: str) -> dict:
+    """Return a /v7/weather/now payload."""
+    return {
+        "code": "200",
+        "updateTime": update_time,
+        "now": {
+            "obsTime": update_time,
+            "temp": "24",
+            "feelsLike": "26",
+            "icon": "101",
+            "text": "Cloudy",
+            "wind360": "123",
+            "windDir": "SE",
+            "windScale": "1",
+            "windSpeed": "3",
+            "humidity": "72",
+            "precip": "0.0",
+            "pressure": "1003",
+            "vis": "16",
+            "cloud": "10",
+            "dew": "21",
+        },
+    }
+
+
+def hourly_payload(update_time: str, hours: int) -> dict:
+    """Return a /v7/weather/{hours}h payload."""
+    start = datetime.now(TZ).replace(minute=0, second=0, microsecond=0)
+    return {
+        "code": "200",
+        "updateTime": update_time,
+        "hourly": [
+            {
+                "fxTime": _timestamp(start + timedelta(hours=hour)),
+                "temp": str(20 + hour % 8),
+                "icon": "305" if hour % 5 == 0 else "100",
+                "text": "Light Rain" if hour % 5 == 0 else "Sunny",
+                "wind360": "287",
+                "windDir": "WNW",
+                "windScale": "3-4",
+                "windSpeed": "16",
+                "humidity": "57",
+                "pop": str(hour % 100),
+                "precip": "0.0",
+                "pressure": "1013",
+                "cloud": "10",
+                "dew": "12",
+            }
+            for hour in range(hours)
+        ],
+    }
+
+
+def daily_payload(update_time: str, days: int) -> dict:
+    """Return a /v7/weather/{days}d payload."""
+    today = datetime.now(TZ).date()
+    return {
+        "code": "200",
+        "updateTime": update_time,
+        "daily": [
+            {
+                "fxDate": (today + timedelta(days=day)).isoformat(),
+                "tempMax": str(28 + day % 4),
+                "tempMin": str(18 + day % 4),
+                "iconDay": "104",
+                "textDay": "Overcast",
+                "iconNight": "151",
+                "textNight": "Cloudy",
+                "wind360Day": "45",
+                "windDirDay": "NE",
+                "windScaleDay": "1-2",
+                "windSpeedDay": "3",
+                "wind360Night": "0",
+                "windSpeedNight": "3",
+                "humidity": "65",
+                "precip": "0.0",
+                "pressure": "1020",
+                "vis": "25",
+                "cloud": "4",
+                "uvIndex": "3",
+            }
+            for day in range(days)
+        ],
+    }
+
+
+def minutely_payload(update_time: str) -> dict:
+    """Return a /v7/minutely/5m payload."""
+    moment = datetime.fromisoformat(update_time)
+    start = moment.replace(minute=moment.minute - moment.minute % 5)
+    return {
+        "code": "200",
+        "updateTime": update_time,
+        "summary": "Light rain in 20 minutes",
+        "minutely": [
+            {
+                "fxTime": _timestamp(start + timedelta(minutes=5 * slot)),
+                "precip": "0.12" if 4 <= slot < 12 else "0.00",
+                "type": "rain",
+            }
+            for slot in range(24)
+        ],
+    }
+
+
+def warning_payload(update_time: str) -> dict:
+    """Return a /v7/warning/now payload with one active warning."""
+    return {
+        "code": "200",
+        "updateTime": update_time,
+        "warning": [
+            {
+                "id": "10101010020230101000000000000001",
+                "sender": "Beijing Meteorological Observatory",
+                "pubTime": update_time,
+                "title": "Beijing issued a yellow rainstorm warning",
+                "startTime": update_time,
+                "endTime": update_time,
+                "status": "active",
+                "level": "",
+                "severity": "Moderate",
+                "severityColor": "Yellow",
+                "type": "1003",
+                "typeName": "Rainstorm",
+                "urgency": "",
+                "certainty": "",
+                "text": "Heavy rain is expected in the next 6 hours.",
+                "related": "",
+            }
+        ],
+    }
+
+
+def air_payload(update_time: str) -> dict:
+    """Return a /v7/air/now payload."""
+    return {
+        "code": "200",
+        "updateTime": update_time,
+        "now": {
+            "pubTime": update_time,
+            "aqi": "28",
+            "level": "1",
+            "category": "Excellent",
+            "primary": "NA",
+            "pm10": "28",
+            "pm2p5": "5",
+            "no2": "3",
+            "so2": "2",
+            "co": "0.2",
+            "o3": "76",
+        },
+    }
+
+
+def lookup_payload(location: str) -> dict:
+    """Return a /v2/city/lookup payload."""
+    return {
+        "code": "200",
+        "location": [
+            {
+                "name": f"City {location}",
+                "id": str(101010100 + index),
+                "lat": "39.90499",
+                "lon": "116.40529",
+                "adm2": "Beijing",
+                "adm1": "Beijing",
+                "country": "China",
+            }
+            for index in range(3)
+        ],
+    }
+
+
+class FakeQWeather:
+    """aiohttp server answering like QWeather.
+
+    latency: seconds added to every response.
+    error_rate: fraction of requests that fail, in the given error_mode:
+        "code"    - HTTP 200 with code 400 (ApiParamError)
+        "auth"    - HTTP 200 with code 401 (InvalidApiKeyError)
+        "http"    - HTTP 503 without a JSON body (ConnectError)
+        "timeout" - never answers within the client TIMEOUT (ConnectError)
+        "slow"    - answers normally after slow_latency seconds (tail latency)
+    fresh: change updateTime on every response, forcing clients to re-parse.
+    rejected_keys: API key -> error code returned for every request made with it.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        error_mode: str = "code",
+        fresh: bool = False,
+        seed: int = 0,
+        slow_latency: float = 1.0,
+        rejected_keys: dict[str, str] | None = None,
+    ) -> None:
+        """Initialize."""
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_mode = error_mode
+        self.slow_latency = slow_latency
+        self.fresh = fresh
+        self.rejected_keys = rejected_keys or {}
+        self.requests = 0
+        self.rejected = 0
+        self.requests_by_path: dict[str, int] = {}
+        self._random = random.Random(seed)
+        self._runner: web.AppRunner | None = None
+        self.url = ""
+
+        self.app = web.Application()
+        self.app.router.add_get("/v2/city/lookup", self._handle_lookup)
+        self.app.router.add_get("/v7/air/now", self._handle_air)
+        self.app.router.add_get("/v7/minutely/5m", self._handle_minutely)
+        self.app.router.add_get("/v7/warning/now", self._handle_warning)
+        self.app.router.add_get("/v7/weather/now", self._handle_now)
+        self.app.router.add_get("/v7/weather/{hours:\\d+}h", self._handle_hourly)
+        self.app.router.add_get("/v7/weather/{days:\\d+}d", self._handle_daily)
+
+    @property
+    def geo_url(self) -> str:
+        """Replacement for DEFAULT_LOCATION_API_URL."""
+        return f"{self.url}/v2/city/lookup"
+
+    @property
+    def weather_url(self) -> str:
+        """Replacement for DEFAULT_WEATHER_API_URL."""
+        return f"{self.url}/v7/weather/"
+
+    @property
+    def minutely_url(self) -> str:
+        """Replacement for DEFAULT_MINUTELY_API_URL."""
+        return f"{self.url}/v7/minutely/5m"
+
+    @property
+    def warning_url(self) -> str:
+        """Replacement for DEFAULT_WARNING_API_URL."""
+        return f"{self.url}/v7/warning/now"
+
+    @property
+    def air_url(self) -> str:
+        """Replacement for DEFAULT_AIRQUALITY_API_URL."""
+        return f"{self.url}/v7/air/now"
+
+    async def start(self) -> None:
+        """Start listening on a free local port."""
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self) -> None:
+        """Stop the server."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def _update_time(self) -> str:
+        moment = datetime.now(TZ).replace(second=0, microsecond=0)
+        if self.fresh:
+            moment -= timedelta(minutes=self.requests)
+        return _timestamp(moment)
+
+    async def _respond(self, request: web.Request, payload) -> web.StreamResponse:
+        self.requests += 1
+        self.requests_by_path[request.path] = self.requests_by_path.get(request.path, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        code = self.rejected_keys.get(request.query.get("key"))
+        if code is not None:
+            self.rejected += 1
+            return web.json_response({"code": code})
+        if self.error_rate and self._random.random() < self.error_rate:
+            if self.error_mode == "timeout":
+                await asyncio.sleep(3600)
+            if self.error_mode == "slow":
+                await asyncio.sleep(self.slow_latency)
+                return web.json_response(payload(self._update_time()))
+            if self.error_mode == "http":
+                return web.Response(status=503, text="Service Unavailable")
+            code = "401" if self.error_mode == "auth" else "400"
+            return web.json_response({"code": code})
+        return web.json_response(payload(self._update_time()))
+
+    async def _handle_now(self, request: web.Request) -> web.StreamResponse:
+        return await self._respond(request, now_payload)
+
+    async def _handle_air(self, request: web.Request) -> web.StreamResponse:
+        return await self._respond(request, air_payload)
+
+    async def _handle_minutely(self, request: web.Request) -> web.StreamResponse:
+        return await self._respond(request, minutely_payload)
+
+    async def _handle_warning(self, request: web.Request) -> web.StreamResponse:
+        return await self._respond(request, warning_payload)
+
+    async def _handle_hourly(self, request: web.Request) -> web.StreamResponse:
+        hours = int(request.match_info["hours"])
+        return await self._respond(request, lambda update: hourly_payload(update, hours))
+
+    async def _handle_daily(self, request: web.Request) -> web.StreamResponse:
+        days = int(request.match_info["days"])
+        return await self._respond(request, lambda update: daily_payload(update, days))
+
+    async def _handle_lookup(self, request: web.Request) -> web.StreamResponse:
+        location = request.query.get("location", "")
+        return await self._respond(request, lambda _: lookup_payload(location))
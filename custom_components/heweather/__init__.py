@@ -1,43 +1,133 @@
 """The HeWeather component."""
 from __future__ import annotations
 
+import asyncio
+from collections.abc import Awaitable, Callable
 from datetime import timedelta
+from functools import partial
 import logging
+import random
+import time
+from typing import Any
 
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import (
     CONF_LOCATION,
     CONF_API_KEY,
     CONF_SCAN_INTERVAL,
+    EVENT_HOMEASSISTANT_STARTED,
     Platform,
 )
 
-from homeassistant.core import Event, HomeAssistant
+from homeassistant.core import CoreState, Event, HomeAssistant, callback
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 
-from .heweather import HeWeather
+from .heweather import HeWeather, HeWeatherFetcher, TIMEOUT, parse_api_keys
+from .services import async_setup_services
 from .const import (
     DOMAIN,
+    DATA_FETCHER,
+    DATA_STARTUP,
     CONF_FORECAST,
+    CONF_FORECAST_HOURLY,
+    CONF_NOWCAST,
+    CONF_WARNINGS,
+    CONF_DAILY_QUOTA,
+    CONF_API_KEYS,
+    CONF_FAST_START,
+    CONF_HEDGE,
+    DEFAULT_DAILY_QUOTA,
+    EVENT_WARNING,
+    STORAGE_KEY,
+    STORAGE_VERSION,
+    HISTORY_STORAGE_KEY,
+    HEWEATHER_FORECAST,
+    HEWEATHER_TEMPERATURE,
 )
 
-PLATFORMS = [Platform.WEATHER]
+PLATFORMS = [Platform.WEATHER, Platform.SENSOR]
+
+# 只能通过界面添加,async_setup仅用于注册服务
+CONFIG_SCHEMA = cv.config_entry_only_config_schema(DOMAIN)
 
 _LOGGER = logging.getLogger(__name__)
 
+# 分钟级降水预报的刷新间隔,与接口的更新频率一致
+NOWCAST_INTERVAL = timedelta(minutes=5)
+# 气象预警的刷新间隔,有生效中的预警时加快
+WARNING_INTERVAL = timedelta(minutes=15)
+WARNING_ACTIVE_INTERVAL = timedelta(minutes=5)
+# 快速启动时在后台同时进行的首次刷新数
+STARTUP_CONCURRENCY = 4
+
+
+async def async_setup(hass: HomeAssistant, config: dict) -> bool:
+    """Set up the HeWeather services."""
+    async_setup_services(hass)
+    return True
+
 
 async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> bool:
     """Set up HeWeather as config entry."""
-    coordinator = HeWeatherDataUpdateCoordinator(hass, config_entry)
-    await coordinator.async_config_entry_first_refresh()
+    start = time.monotonic()
+    fetcher = async_acquire_fetcher(hass)
+    coordinator = HeWeatherDataUpdateCoordinator(hass, config_entry, fetcher)
+    try:
+        await fetcher.async_load()
+        # 有缓存时先用缓存数据创建实体,再在后台刷新
+        if await coordinator.async_warm_start():
+            coordinator.setup_stats["mode"] = "cache"
+        elif config_entry.options.get(CONF_FAST_START, False):
+            # 快速启动:无缓存时实体先以不可用状态创建,首次刷新在后台进行
+            coordinator.async_defer_first_refresh()
+            coordinator.setup_stats["mode"] = "deferred"
+        else:
+            await coordinator.async_config_entry_first_refresh()
+            coordinator.setup_stats["mode"] = "refresh"
+    except Exception:
+        fetcher.remove_keys(coordinator.api_keys)
+        fetcher.set_hedge(config_entry.entry_id, False)
+        await async_release_fetcher(hass)
+        raise
+
+    if config_entry.options.get(CONF_NOWCAST, False):
+        # 降水预报单独定时刷新,不触发天气数据的刷新;首次刷新在后台进行,不阻塞启动
+        coordinator.nowcast = HeWeatherStreamCoordinator(
+            hass,
+            f"{DOMAIN}_nowcast",
+            NOWCAST_INTERVAL,
+            partial(
+                coordinator.weather.async_fetch_nowcast,
+                max(NOWCAST_INTERVAL.total_seconds() - TIMEOUT, 0),
+            ),
+            coordinator.weather.nowcast,
+        )
+        if coordinator.setup_stats["mode"] != "deferred":
+            hass.async_create_task(coordinator.nowcast.async_refresh())
+
+    if config_entry.options.get(CONF_WARNINGS, False):
+        coordinator.warning = HeWeatherWarningCoordinator(hass, config_entry, coordinator.weather)
+        # 以缓存中的预警为基准,重启后不再重复触发事件
+        await coordinator.weather.async_fetch_warnings(cache_only=True)
+        if coordinator.setup_stats["mode"] != "deferred":
+            hass.async_create_task(coordinator.warning.async_refresh())
 
     config_entry.async_on_unload(config_entry.add_update_listener(update_listener))
 
-    hass.data.setdefault(DOMAIN, {})
     hass.data[DOMAIN][config_entry.entry_id] = coordinator
 
     hass.config_entries.async_setup_platforms(config_entry, PLATFORMS)
 
+    coordinator.setup_stats["setup_time"] = round(time.monotonic() - start, 3)
+    _LOGGER.debug(
+        "Set up %s in %.3f s (%s)",
+        config_entry.title,
+        coordinator.setup_stats["setup_time"],
+        coordinator.setup_stats["mode"],
+    )
     return True
 
 
@@ -46,35 +136,266 @@ async def async_unload_entry(hass: HomeAssistant, config_entry: ConfigEntry) ->
     unload_ok = await hass.config_entries.async_unload_platforms(
         config_entry, PLATFORMS
     )
-    hass.data[DOMAIN].pop(config_entry.entry_id)
+    # 共享会话由HA统一管理,此处只释放引用,不能关闭
+    coordinator = hass.data[DOMAIN].pop(config_entry.entry_id)
+    coordinator.async_cancel_first_refresh()
+    hass.data[DOMAIN][DATA_FETCHER].remove_keys(coordinator.api_keys)
+    hass.data[DOMAIN][DATA_FETCHER].set_hedge(config_entry.entry_id, False)
+    await async_release_fetcher(hass)
 
     return unload_ok
 
 
+@callback
+def async_acquire_fetcher(hass: HomeAssistant) -> HeWeatherFetcher:
+    """Return the fetcher shared by all entries and take a reference to it."""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if DATA_FETCHER not in domain_data:
+        domain_data[DATA_FETCHER] = HeWeatherFetcher(
+            async_get_clientsession(hass),
+            Store(hass, STORAGE_VERSION, STORAGE_KEY),
+            history_store=Store(hass, STORAGE_VERSION, HISTORY_STORAGE_KEY),
+        )
+    fetcher: HeWeatherFetcher = domain_data[DATA_FETCHER]
+    fetcher.refcount += 1
+    return fetcher
+
+
+async def async_release_fetcher(hass: HomeAssistant) -> None:
+    """Drop a reference to the shared fetcher, saving and tearing it down after the last one."""
+    fetcher: HeWeatherFetcher = hass.data[DOMAIN][DATA_FETCHER]
+    fetcher.refcount -= 1
+    if fetcher.refcount <= 0:
+        # 立即写入延迟保存的数据,否则重新加载时新的fetcher读到旧文件,并在下次保存时覆盖
+        await fetcher.async_save()
+        # 保存期间可能已有条目重新取得引用,此时继续使用该fetcher
+        if fetcher.refcount > 0:
+            return
+        hass.data[DOMAIN].pop(DATA_FETCHER)
+        hass.data[DOMAIN].pop(DATA_STARTUP, None)
+
+
 async def update_listener(hass: HomeAssistant, config_entry: ConfigEntry) -> None:
     """Update listener."""
     await hass.config_entries.async_reload(config_entry.entry_id)
 
 
-class HeWeatherDataUpdateCoordinator(DataUpdateCoordinator):
+class HeWeatherCoordinator(DataUpdateCoordinator):
+    """Base class of the HeWeather coordinators.
+
+    _async_fetch returns whether the data changed along with the data;
+    listeners are only notified when it did.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        """Initialize the coordinator."""
+        # 数据未变化时跳过实体状态写入
+        self._skip_update = False
+        super().__init__(*args, **kwargs)
+
+    async def _async_fetch(self) -> tuple[bool, Any]:
+        raise NotImplementedError
+
+    async def _async_update_data(self):
+        """Fetch the data."""
+        self._skip_update = False
+        changed, data = await self._async_fetch()
+        # 上次更新失败时仍需通知实体恢复可用
+        self._skip_update = not changed and self.last_update_success
+        return data
+
+    @callback
+    def async_update_listeners(self) -> None:
+        """Update all registered listeners, unless the data did not change."""
+        if self._skip_update:
+            self._skip_update = False
+            return
+        super().async_update_listeners()
+
+
+class HeWeatherDataUpdateCoordinator(HeWeatherCoordinator):
     """Class to manage fetching HeWeather data."""
 
-    def __init__(self, hass: HomeAssistant, config_entry: ConfigEntry) -> None:
+    def __init__(self, hass: HomeAssistant, config_entry: ConfigEntry, fetcher: HeWeatherFetcher) -> None:
         """Initialize global HeWeather data updater."""
+        update_interval = timedelta(minutes=config_entry.options.get(CONF_SCAN_INTERVAL, 30))
         self.weather = HeWeather(
+            fetcher,
             config_entry.data[CONF_LOCATION],
             config_entry.data[CONF_API_KEY],
-            config_entry.options.get(CONF_FORECAST, 3)
+            config_entry.options.get(CONF_FORECAST, 3),
+            update_interval.total_seconds(),
+            config_entry.options.get(CONF_FORECAST_HOURLY, 0),
         )
+        # 条目的KEY及额外配置的KEY加入所有条目共享的KEY池,请求时选用用量最少的KEY;
+        # 同一KEY的所有条目共享每日额度,0表示不限制
+        self.api_keys = [
+            config_entry.data[CONF_API_KEY],
+            *parse_api_keys(config_entry.options.get(CONF_API_KEYS, "")),
+        ]
+        fetcher.add_keys(self.api_keys)
+        # 对冲请求由fetcher统一处理,任一条目启用即对所有请求生效
+        fetcher.set_hedge(config_entry.entry_id, config_entry.options.get(CONF_HEDGE, False))
+        for api_key in self.api_keys:
+            fetcher.set_quota(
+                api_key,
+                config_entry.options.get(CONF_DAILY_QUOTA, DEFAULT_DAILY_QUOTA),
+            )
 
-        update_interval = timedelta(minutes=config_entry.options.get(CONF_SCAN_INTERVAL, 30))
+        # 分钟级降水预报,未启用时为None
+        self.nowcast: HeWeatherStreamCoordinator | None = None
+        # 气象预警,未启用时为None
+        self.warning: HeWeatherWarningCoordinator | None = None
+        # 启动方式及耗时(秒),用于诊断
+        self._title = config_entry.title
+        self.setup_stats: dict = {"mode": None, "setup_time": None, "first_refresh_time": None}
+        self._first_refresh: asyncio.Task | None = None
+        self._deferred = False
 
-        super().__init__(hass, _LOGGER, name=DOMAIN, update_interval=update_interval)
+        # 首次定时刷新推迟[0, 刷新间隔)内的随机时间,同时启动的条目均匀分布在刷新间隔内
+        self._interval = update_interval
+        self._offset_until = time.monotonic() + update_interval.total_seconds()
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=DOMAIN,
+            update_interval=update_interval + random.uniform(0, 1) * update_interval,
+        )
 
-    async def _async_update_data(self):
+    async def async_warm_start(self) -> bool:
+        """Populate data from the response cache and schedule a refresh."""
+        await self.weather.async_fetch_data(cache_only=True)
+        data = self.weather.weather_data
+        if HEWEATHER_TEMPERATURE not in data or HEWEATHER_FORECAST not in data:
+            return False
+        self.async_set_updated_data(data)
+        # 缓存未过期时后台刷新不会产生网络请求
+        self.hass.async_create_task(self.async_request_refresh())
+        return True
+
+    @callback
+    def async_defer_first_refresh(self) -> None:
+        """Start with unavailable entities and refresh once Home Assistant has started."""
+        self.data = self.weather.weather_data
+        self.last_update_success = False
+        self._deferred = True
+        if self.hass.state == CoreState.running:
+            self._async_start_first_refresh()
+        else:
+            # HA启动完成后再刷新,不占用启动时间
+            self.hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STARTED, self._async_start_first_refresh)
+
+    @callback
+    def _async_start_first_refresh(self, _event: Event | None = None) -> None:
+        if not self._deferred:
+            # 条目在HA启动完成前已卸载
+            return
+        semaphore = self.hass.data[DOMAIN].setdefault(DATA_STARTUP, asyncio.Semaphore(STARTUP_CONCURRENCY))
+        self._first_refresh = self.hass.async_create_task(self._async_first_refresh(semaphore))
+
+    async def _async_first_refresh(self, semaphore: asyncio.Semaphore) -> None:
+        start = time.monotonic()
+        # 大量条目同时启动时限制并发,失败后按刷新间隔重试
+        async with semaphore:
+            await self.async_refresh()
+        self.setup_stats["first_refresh_time"] = round(time.monotonic() - start, 3)
+        _LOGGER.debug("First refresh of %s took %.3f s", self._title, self.setup_stats["first_refresh_time"])
+        # 快速启动时降水预报及预警的首次刷新也在此进行,同样受并发限制
+        for stream in (self.nowcast, self.warning):
+            if stream is not None:
+                async with semaphore:
+                    await stream.async_refresh()
+
+    @callback
+    def async_cancel_first_refresh(self) -> None:
+        """Cancel a deferred first refresh that has not finished yet."""
+        self._deferred = False
+        if self._first_refresh is not None and not self._first_refresh.done():
+            self._first_refresh.cancel()
+
+    async def _async_fetch(self) -> tuple[bool, dict]:
         """Fetch data from HeWeather."""
+        if self.update_interval != self._interval and time.monotonic() >= self._offset_until:
+            # 首次定时刷新,此后按配置的间隔刷新;启动时的刷新不受影响
+            self.update_interval = self._interval
         try:
-            await self.weather.async_fetch_data()
+            changed = await self.weather.async_fetch_data()
         except Exception as err:
             raise UpdateFailed(f"Update failed: {err}") from err
-        return self.weather.weather_data
\ No newline at end of file
+        # 接口错误在HeWeather中已被处理;从未取得实况数据时视为刷新失败,实体保持不可用并按间隔重试
+        if HEWEATHER_TEMPERATURE not in self.weather.weather_data:
+            raise UpdateFailed("No current conditions received")
+        return changed, self.weather.weather_data
+
+
+class HeWeatherStreamCoordinator(HeWeatherCoordinator):
+    """Class to poll one data stream of a location at its own interval.
+
+    fetch returns whether the stream data changed; listeners are only
+    notified when it did.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        name: str,
+        update_interval: timedelta,
+        fetch: Callable[[], Awaitable[bool]],
+        data,
+    ) -> None:
+        """Initialize the stream coordinator."""
+        self._fetch = fetch
+        super().__init__(hass, _LOGGER, name=name, update_interval=update_interval)
+        # 数据对象在原处更新,实体创建时即可读取
+        self.data = data
+
+    async def _async_fetch(self) -> tuple[bool, Any]:
+        """Fetch the stream."""
+        return await self._fetch(), self.data
+
+
+class HeWeatherWarningCoordinator(HeWeatherStreamCoordinator):
+    """Class to poll the weather warnings of a location.
+
+    An EVENT_WARNING event is fired for every warning that was issued, updated
+    or cleared since the previous poll.
+    """
+
+    def __init__(self, hass: HomeAssistant, config_entry: ConfigEntry, weather: HeWeather) -> None:
+        """Initialize the warning coordinator."""
+        self._config_entry = config_entry
+        self._weather = weather
+        super().__init__(
+            hass,
+            f"{DOMAIN}_warning",
+            WARNING_INTERVAL,
+            self._async_fetch_warnings,
+            weather.warnings,
+        )
+
+    async def _async_fetch_warnings(self) -> bool:
+        changed = await self._weather.async_fetch_warnings(
+            max(self.update_interval.total_seconds() - TIMEOUT, 0)
+        )
+        self.update_interval = WARNING_ACTIVE_INTERVAL if self._weather.warnings.warnings else WARNING_INTERVAL
+        if changed:
+            for change, warnings in zip(("new", "updated", "cleared"), self._weather.warnings.changes):
+                for warning in warnings:
+                    self.hass.bus.async_fire(
+                        EVENT_WARNING,
+                        {
+                            "entry_id": self._config_entry.entry_id,
+                            "location": self._config_entry.data[CONF_LOCATION],
+                            "change": change,
+                            "id": warning["id"],
+                            "title": warning.get("title"),
+                            "severity": warning.get("severity") or warning.get("level"),
+                            "type": warning.get("type"),
+                            "type_name": warning.get("typeName"),
+                            "status": warning.get("status"),
+                            "start_time": warning.get("startTime"),
+                            "end_time": warning.get("endTime"),
+                            "text": warning.get("text"),
+                        },
+                    )
+        return changed
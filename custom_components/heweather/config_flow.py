@@ -1,10 +1,13 @@
 """Config flow to configure HeWeather component."""
 from __future__ import annotations
 
+import asyncio
+
 import voluptuous as vol
 from homeassistant import config_entries
 from homeassistant.core import callback
 import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from homeassistant.const import(
     CONF_LOCATION,
     CONF_NAME,
@@ -15,9 +18,21 @@ from homeassistant.const import(
 from .heweather import HeWeather, ConnectError, InvalidApiKeyError, ApiParamError
 from .const import (
     DOMAIN,
+    DATA_FETCHER,
     DEFAULT_NAME,
     CONF_FORECAST,
-    CONF_CITY_SELECT
+    CONF_FORECAST_HOURLY,
+    CONF_FORECAST_WINDOW,
+    CONF_NOWCAST,
+    CONF_WARNINGS,
+    CONF_CITY_SELECT,
+    CONF_DAILY_QUOTA,
+    CONF_API_KEYS,
+    CONF_FAST_START,
+    CONF_HEDGE,
+    DEFAULT_DAILY_QUOTA,
+    FORECAST_HOURS,
+    FORECAST_DAYS,
 )
 
 
@@ -78,6 +93,7 @@ class HeWeatherFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
                 self.citylist = {}
                 try:
                     self.citylist = await HeWeather.async_get_location(
+                        async_get_clientsession(self.hass),
                         self.location,
                         self.key
                     )
@@ -90,6 +106,13 @@ class HeWeatherFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
 
         return self.async_show_config_form()
 
+    async def async_step_import(self, import_data):
+        """Handle a location added by the import_locations service."""
+        # 地点已由服务批量查询,此处直接创建条目
+        await self.async_set_unique_id(import_data[CONF_LOCATION])
+        self._abort_if_unique_id_configured()
+        return self.async_create_entry(title=import_data[CONF_NAME], data=import_data)
+
 
     @staticmethod
     @callback
@@ -104,26 +127,32 @@ class HeWeatherOptionsFlowHandler(config_entries.OptionsFlow):
     def __init__(self, config_entry: config_entries.ConfigEntry) -> None:
         """Initialize HeWeather options flow."""
         self.config_entry = config_entry
+        self._permission_task: asyncio.Task | None = None
 
     async def async_step_init(self, user_input = None):
         """Manage the options."""
         errors = {}
         forecast = {3:"3 days"}
+        hourly = {0:"None"}
         if user_input is not None:
             if not errors:
                 return self.async_create_entry(title="", data=user_input)
 
+        # 在任务中检查权限,关闭选项窗口时可取消
+        self._permission_task = self.hass.async_create_task(self._async_get_permissions())
         try:
-            _flag = await HeWeather.async_get_key_permission(
-                self.config_entry.data.get(CONF_LOCATION),
-                self.config_entry.data.get(CONF_API_KEY)
-            )
-        except:
+            _flag, _extended = await self._permission_task
+        except Exception:
             pass
         else:
             if _flag:
                 forecast[7] = "7 days"
                 forecast[1] = "24 hours"
+                hourly[24] = "24 hours"
+            if _extended:
+                forecast.update({days: f"{days} days" for days in FORECAST_DAYS})
+                forecast.update({hours: f"{hours} hours" for hours in FORECAST_HOURS[1:]})
+                hourly.update({hours: f"{hours} hours" for hours in FORECAST_HOURS})
 
         settings_schema = vol.Schema(
             {
@@ -131,13 +160,67 @@ class HeWeatherOptionsFlowHandler(config_entries.OptionsFlow):
                     CONF_FORECAST,
                     default=self.config_entry.options.get(CONF_FORECAST, 3),
                 ): vol.In(forecast),
+                vol.Required(
+                    CONF_FORECAST_HOURLY,
+                    default=self.config_entry.options.get(CONF_FORECAST_HOURLY, 0),
+                ): vol.In(hourly),
+                vol.Required(
+                    CONF_FORECAST_WINDOW,
+                    default=self.config_entry.options.get(CONF_FORECAST_WINDOW, 0),
+                ): vol.All(vol.Coerce(int), vol.Range(min=0)),
+                vol.Required(
+                    CONF_NOWCAST,
+                    default=self.config_entry.options.get(CONF_NOWCAST, False),
+                ): bool,
+                vol.Required(
+                    CONF_WARNINGS,
+                    default=self.config_entry.options.get(CONF_WARNINGS, False),
+                ): bool,
                 vol.Required(
                     CONF_SCAN_INTERVAL,  
                     default=self.config_entry.options.get(CONF_SCAN_INTERVAL, 30),
                 ): vol.In([5,10,30,60]),
+                vol.Required(
+                    CONF_DAILY_QUOTA,
+                    default=self.config_entry.options.get(CONF_DAILY_QUOTA, DEFAULT_DAILY_QUOTA),
+                ): vol.All(vol.Coerce(int), vol.Range(min=0)),
+                vol.Optional(
+                    CONF_API_KEYS,
+                    default=self.config_entry.options.get(CONF_API_KEYS, ""),
+                ): str,
+                vol.Required(
+                    CONF_FAST_START,
+                    default=self.config_entry.options.get(CONF_FAST_START, False),
+                ): bool,
+                vol.Required(
+                    CONF_HEDGE,
+                    default=self.config_entry.options.get(CONF_HEDGE, False),
+                ): bool,
             }
         )
 
         return self.async_show_form(
             step_id="init", data_schema=settings_schema, errors=errors
         )
+
+    async def _async_get_permissions(self) -> list[bool]:
+        """Check the basic and the extended forecast permission of the key."""
+        # 更长的预报(72h/168h,10d/15d/30d)需要更高的KEY权限,以168h探测
+        return await asyncio.gather(
+            *(
+                HeWeather.async_get_key_permission(
+                    async_get_clientsession(self.hass),
+                    self.config_entry.data.get(CONF_LOCATION),
+                    self.config_entry.data.get(CONF_API_KEY),
+                    self.hass.data.get(DOMAIN, {}).get(DATA_FETCHER),
+                    endpoint,
+                )
+                for endpoint in ("24h", "168h")
+            )
+        )
+
+    @callback
+    def async_remove(self) -> None:
+        """Cancel the permission check when the flow is closed."""
+        if self._permission_task is not None:
+            self._permission_task.cancel()
@@ -73,6 +73,21 @@ CONDITIONS_MAP = {
     "sunny": {"Sunny"},
 }
 
+# 和风天气图标代码,与语言无关
+CONDITIONS_ICON_MAP = {
+    "clear-night": {"150"},
+    "cloudy": {"104", "154"},
+    "fog": {"500", "501", "509", "510", "514", "515"},
+    "lightning-rainy": {"302", "303", "304"},
+    "partlycloudy": {"101", "102", "103", "151", "152", "153"},
+    "rainy": {"300", "305", "306", "309", "314", "315", "350", "399"},
+    "pouring": {"301", "307", "308", "310", "311", "312", "313", "316", "317", "318", "351"},
+    "snowy": {"400", "401", "402", "403", "407", "408", "409", "410", "457", "499"},
+    "snowy-rainy": {"404", "405", "406", "456"},
+    "exceptional": {"502", "503", "504", "507", "508", "511", "512", "513", "900", "901", "999"},
+    "sunny": {"100"},
+}
+
 HEWEATHER_DATETIME = "datetime"
 HEWEATHER_CONDITION = "condition"
 HEWEATHER_TEMPERATURE = "temperature"
@@ -85,11 +100,51 @@ HEWEATHER_VISIBILITY = "visibility"
 HEWEATHER_WIND_BEARING = "wind_bearing"
 HEWEATHER_WIND_SPEED = "wind_speed"
 HEWEATHER_OZONE = "ozone"
+HEWEATHER_AQI = "aqi"
+HEWEATHER_PM25 = "pm25"
 HEWEATHER_CLOUD = "cloud"
+HEWEATHER_APPARENT_TEMPERATURE = "apparent_temperature"
+HEWEATHER_DEW_POINT = "dew_point"
 HEWEATHER_FORECAST = "forecast"
+HEWEATHER_FORECAST_HOURLY = "forecast_hourly"
+HEWEATHER_NOWCAST = "nowcast"
+HEWEATHER_WARNING = "warning"
+HEWEATHER_HISTORY = "history"
+
+DATA_FETCHER = "fetcher"
+DATA_STARTUP = "startup"
+
+# 气象预警新增、更新或解除时触发的事件
+EVENT_WARNING = "heweather_warning"
+
+# 批量导入/导出地点的服务
+SERVICE_IMPORT_LOCATIONS = "import_locations"
+SERVICE_EXPORT_LOCATIONS = "export_locations"
+ATTR_LOCATIONS = "locations"
+ATTR_FILE = "file"
+DEFAULT_EXPORT_FILE = "heweather_locations.csv"
+
+STORAGE_KEY = "heweather.cache"
+HISTORY_STORAGE_KEY = "heweather.history"
+STORAGE_VERSION = 1
 
 CONF_FORECAST = "forecast"
+CONF_FORECAST_HOURLY = "forecast_hourly"
+CONF_FORECAST_WINDOW = "forecast_window"
+CONF_NOWCAST = "nowcast"
+CONF_WARNINGS = "warnings"
 CONF_CITY_SELECT = "city_select"
+CONF_DAILY_QUOTA = "daily_quota"
+CONF_API_KEYS = "api_keys"
+CONF_FAST_START = "fast_start"
+CONF_HEDGE = "hedge"
+
+# 可选的预报时长:逐小时(小时)及逐天(天),CONF_FORECAST为1时为24小时预报
+FORECAST_HOURS = (24, 72, 168)
+FORECAST_DAYS = (3, 7, 10, 15, 30)
+
+# 免费KEY的每日请求额度
+DEFAULT_DAILY_QUOTA = 1000
 
 DEFAULT_NAME = "Home"
 
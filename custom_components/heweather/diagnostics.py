@@ -0,0 +1,27 @@
+"""Diagnostics support for HeWeather."""
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_API_KEY
+from homeassistant.core import HomeAssistant
+
+from . import HeWeatherDataUpdateCoordinator
+from .const import CONF_API_KEYS, DOMAIN
+
+TO_REDACT = {CONF_API_KEY, CONF_API_KEYS}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, config_entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    coordinator: HeWeatherDataUpdateCoordinator = hass.data[DOMAIN][config_entry.entry_id]
+    return {
+        "entry": async_redact_data(config_entry.as_dict(), TO_REDACT),
+        "last_update_success": coordinator.last_update_success,
+        "setup": coordinator.setup_stats,
+        "requests": coordinator.weather.diagnostics(),
+    }
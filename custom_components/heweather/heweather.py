@@ -1,65 +1,684 @@
+from __future__ import annotations
+
+from array import array
 import asyncio
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from collections.abc import Iterable
+from datetime import datetime, timezone, tzinfo
+from functools import partial
+import json
 import logging
+import math
+import random
+import re
+import time
+from urllib.parse import urlsplit
 import aiohttp
 import async_timeout
 
 from .const import (
     CONDITIONS_MAP,
+    CONDITIONS_ICON_MAP,
     HEWEATHER_FORECAST,
+    HEWEATHER_FORECAST_HOURLY,
     HEWEATHER_DATETIME,
     HEWEATHER_CONDITION,
     HEWEATHER_TEMPERATURE,
     HEWEATHER_TEMP_LOW,
     HEWEATHER_HUMIDITY,
+    HEWEATHER_APPARENT_TEMPERATURE,
+    HEWEATHER_DEW_POINT,
+    HEWEATHER_CLOUD,
     HEWEATHER_PRESSURE,
     HEWEATHER_PRECIPITATION,
     HEWEATHER_PRECIPITATION_PROBABILITY,
     HEWEATHER_VISIBILITY,
     HEWEATHER_WIND_BEARING,
     HEWEATHER_WIND_SPEED,
+    HEWEATHER_OZONE,
+    HEWEATHER_AQI,
+    HEWEATHER_PM25,
+    FORECAST_HOURS,
 )
 
 DEFAULT_LOCATION_API_URL = "https://geoapi.qweather.com/v2/city/lookup"
 DEFAULT_WEATHER_API_URL = "https://devapi.qweather.com/v7/weather/"
 DEFAULT_AIRQUALITY_API_URL = "https://devapi.qweather.com/v7/air/now"
+DEFAULT_MINUTELY_API_URL = "https://devapi.qweather.com/v7/minutely/5m"
+DEFAULT_WARNING_API_URL = "https://devapi.qweather.com/v7/warning/now"
 
+# 一次请求(包括排队及重试)的总时长上限,及其中每次尝试的超时(秒)
 TIMEOUT = 10
+ATTEMPT_TIMEOUT = 4
+ATTEMPT_MIN_TIMEOUT = 1
+# 连接失败后的重试次数,及重试等待时间的基数(秒),实际等待时间随机抖动
+RETRIES = 2
+RETRY_BACKOFF = 0.5
+# 同一服务器连续失败该次数后熔断,期间直接使用缓存数据;冷却后放行一个探测请求
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 60
+# 对冲请求:首个请求超过该接口p95耗时仍未返回时,再发出一个相同的请求
+HEDGE_MIN_DELAY = 0.2
+HEDGE_MIN_SAMPLES = 20
+# KEY池:返回以下错误码的KEY暂停使用的时间(秒),请求改用池中的其他KEY
+# 401无效,402额度或余额不足,429超过访问频率;403多为无权访问该接口,只对该接口暂停
+KEY_EJECT_TIMES = {401: 3600, 402: 3600, 403: 3600, 429: 60}
+# 缓存数据的最长保留时间(秒),超过后不再作为接口故障时的备用数据
+CACHE_MAX_AGE = 6 * 3600
+# 缓存写入磁盘的延迟(秒),合并短时间内的多次更新
+CACHE_SAVE_DELAY = 60
+# 根据数据更新频率自动延长的缓存有效期上限(秒)
+ADAPTIVE_MAX_TTL = 3 * 3600
+# 超过有效期该倍数的时间未再请求的数据,不再计入额度的分配
+DEMAND_IDLE_FACTOR = 2
+# 请求失败后的重试间隔(秒),每次失败翻倍
+BACKOFF_BASE = 60
+BACKOFF_MAX = 3600
+# 每个请求保留的耗时样本数,用于计算分位数
+LATENCY_SAMPLES = 200
+# 同时进行的请求数上限,及每个KEY每秒的请求数(令牌桶)
+MAX_CONCURRENT_REQUESTS = 10
+RATE_LIMIT = 5
+RATE_BURST = 10
+# 预报数据的最短刷新间隔(秒),实况数据按配置的刷新时间更新
+FORECAST_TTL = 3600
+# 空气质量数据每小时更新
+AIR_TTL = 3600
+# 城市查询结果的缓存数量及有效期(秒)
+LOCATION_CACHE_SIZE = 128
+LOCATION_CACHE_TTL = 24 * 3600
+# KEY权限结果的有效期(秒)
+PERMISSION_CACHE_TTL = 24 * 3600
+# 权限探测只读取响应开头的返回码,最多读取的字节数
+PROBE_MAX_BYTES = 1024
+_CODE_RE = re.compile(rb'"code"\s*:\s*"(\d+)"')
+# 分钟级降水预报:未来2小时,每5分钟一条
+NOWCAST_SLOTS = 24
+NOWCAST_STEP = 5 * 60
+# 实况观测历史:每个地点保留的样本数(5分钟一次时为24小时),滚动统计的时间窗口(秒)
+HISTORY_SIZE = 288
+HISTORY_WINDOWS = (3 * 3600, 24 * 3600)
+# 观测历史写入磁盘的延迟(秒)
+HISTORY_SAVE_DELAY = 10 * 60
+# 经纬度保留的小数位数(约1公里),同一网格内的坐标共用查询和天气数据
+GRID_DECIMALS = 2
 
 _LOGGER = logging.getLogger(__name__)
 
 
-def format_condition(condition: str) -> str:
-    """Return condition from dict CONDITIONS_MAP."""
-    for key, value in CONDITIONS_MAP.items():
-        if condition in value:
-            return key
-    return condition
+# 天气文本(小写)及图标代码到天气状态的索引,导入时构建一次
+_CONDITION_INDEX = {text.lower(): key for key, value in CONDITIONS_MAP.items() for text in value}
+_CONDITION_ICON_INDEX = {icon: key for key, value in CONDITIONS_ICON_MAP.items() for icon in value}
+
+
+_COORDINATES = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$")
+
+
+def snap_location(location: str) -> str:
+    """Round "longitude,latitude" locations to the grid, return others unchanged."""
+    match = _COORDINATES.match(location)
+    if match is None:
+        return location
+    return ",".join(f"{float(value):.{GRID_DECIMALS}f}" for value in match.groups())
+
+
+class _TTLCache:
+    """Small LRU cache whose entries expire after ttl seconds."""
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        """Initialize."""
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        """Return the cached value, or None when missing or expired."""
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if time.monotonic() - item[0] >= self._ttl:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return item[1]
+
+    def set(self, key, value) -> None:
+        """Store value, evicting the least recently used entry when full."""
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        if len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+
+
+# 城市查询及KEY权限结果,配置流程之间共享
+_LOCATION_CACHE = _TTLCache(LOCATION_CACHE_SIZE, LOCATION_CACHE_TTL)
+_PERMISSION_CACHE = _TTLCache(LOCATION_CACHE_SIZE, PERMISSION_CACHE_TTL)
+
+
+def format_condition(condition: str, icon: str | None = None) -> str:
+    """Return condition from icon code, or from text via CONDITIONS_MAP."""
+    key = _CONDITION_ICON_INDEX.get(icon)
+    if key is not None:
+        return key
+    if condition is None:
+        return condition
+    return _CONDITION_INDEX.get(condition.lower(), condition)
+
+
+def dew_point(temperature: float, humidity: float) -> float:
+    """Return the dew point (°C) from temperature (°C) and relative humidity (%), by the Magnus formula."""
+    gamma = math.log(max(humidity, 1) / 100) + 17.62 * temperature / (243.12 + temperature)
+    return round(243.12 * gamma / (17.62 - gamma), 1)
+
+
+class ForecastRow:
+    """One forecast entry, holding the raw API values until it is materialized."""
+
+    __slots__ = (
+        "datetime",
+        "text",
+        "icon",
+        "temperature",
+        "templow",
+        "pressure",
+        "precipitation",
+        "precipitation_probability",
+        "wind_bearing",
+        "wind_speed",
+    )
+
+    def __init__(
+        self,
+        datetime: str,
+        text: str,
+        icon: str | None,
+        temperature: str,
+        templow: str | None,
+        pressure: str,
+        precipitation: str,
+        precipitation_probability: str | None,
+        wind_bearing: str,
+        wind_speed: str,
+    ) -> None:
+        """Initialize."""
+        self.datetime = datetime
+        self.text = text
+        self.icon = icon
+        self.temperature = temperature
+        self.templow = templow
+        self.pressure = pressure
+        self.precipitation = precipitation
+        self.precipitation_probability = precipitation_probability
+        self.wind_bearing = wind_bearing
+        self.wind_speed = wind_speed
+
+    # 以下两个函数用作json.loads的object_hook,解码时即将每条预报转为紧凑的列表,
+    # 不再保留完整的dict;结果仍可JSON序列化,可直接存入缓存
+    @staticmethod
+    def decode_hourly(data: dict) -> list | dict:
+        """Decode an item of the hourly forecast into the field order of this class."""
+        if "fxTime" not in data:
+            return data
+        return [
+            data["fxTime"],
+            data["text"],
+            data.get("icon"),
+            data["temp"],
+            None,
+            data["pressure"],
+            data["precip"],
+            data.get("pop"),
+            data["wind360"],
+            data["windSpeed"],
+        ]
+
+    @staticmethod
+    def decode_daily(data: dict) -> list | dict:
+        """Decode an item of the daily forecast into the field order of this class."""
+        if "fxDate" not in data:
+            return data
+        return [
+            data["fxDate"],
+            data["textDay"],
+            data.get("iconDay"),
+            data["tempMax"],
+            data["tempMin"],
+            data["pressure"],
+            data["precip"],
+            None,
+            data["wind360Day"],
+            data["windSpeedDay"],
+        ]
+
+    @classmethod
+    def from_hourly(cls, data: list | dict) -> ForecastRow:
+        """Create from an item of the hourly forecast, decoded or not."""
+        if isinstance(data, dict):
+            data = cls.decode_hourly(data)
+        return cls(*data)
+
+    @classmethod
+    def from_daily(cls, data: list | dict) -> ForecastRow:
+        """Create from an item of the daily forecast, decoded or not."""
+        if isinstance(data, dict):
+            data = cls.decode_daily(data)
+        return cls(*data)
+
+    def as_forecast(self) -> dict:
+        """Return the entry as a Home Assistant forecast dict."""
+        forecast = {
+            HEWEATHER_DATETIME: self.datetime,
+            HEWEATHER_CONDITION: format_condition(self.text, self.icon),
+            HEWEATHER_TEMPERATURE: float(self.temperature),
+            HEWEATHER_PRESSURE: float(self.pressure),
+            HEWEATHER_PRECIPITATION: float(self.precipitation),
+            HEWEATHER_WIND_BEARING: float(self.wind_bearing),
+            HEWEATHER_WIND_SPEED: float(self.wind_speed),
+        }
+        if self.templow is not None:
+            forecast[HEWEATHER_TEMP_LOW] = float(self.templow)
+        if self.precipitation_probability:
+            forecast[HEWEATHER_PRECIPITATION_PROBABILITY] = int(self.precipitation_probability)
+        return forecast
+
+
+class ForecastSeries:
+    """Forecast rows of one endpoint, materialized lazily and by window."""
+
+    __slots__ = ("rows", "_starts", "_forecasts", "_window")
+
+    def __init__(self, rows: tuple[ForecastRow, ...], tz: tzinfo | None = None) -> None:
+        """Initialize, dates without an offset are taken in the time zone tz."""
+        self.rows = rows
+        # 各条预报的开始时间,用于二分查找当前时段;逐天预报按该地点时区的零点计,而非HA进程的时区
+        self._starts = array(
+            "d",
+            (
+                (moment if moment.tzinfo else moment.replace(tzinfo=tz)).timestamp()
+                for moment in map(datetime.fromisoformat, (row.datetime for row in rows))
+            ),
+        )
+        # 已转换的预报,窗口移动时只转换新进入窗口的条目
+        self._forecasts: list[dict | None] = [None] * len(rows)
+        self._window: tuple[int, int, list[dict]] | None = None
+
+    def __len__(self) -> int:
+        """Return the number of rows."""
+        return len(self.rows)
+
+    def window(self, count: int = 0, now: float | None = None) -> list[dict]:
+        """Return up to count forecasts from the current period on, all when count is 0.
+
+        The same list is returned for as long as the window does not move.
+        """
+        if now is None:
+            now = time.time()
+        start = max(bisect_right(self._starts, now) - 1, 0)
+        if self._window is not None and self._window[:2] == (start, count):
+            return self._window[2]
+        end = len(self.rows) if count <= 0 else min(start + count, len(self.rows))
+        forecasts = self._forecasts
+        for index in range(start, end):
+            if forecasts[index] is None:
+                forecasts[index] = self.rows[index].as_forecast()
+        result = forecasts[start:end]
+        self._window = (start, count, result)
+        return result
+
+
+class NowcastBuffer:
+    """Minutely precipitation forecast in a fixed-size ring buffer.
+
+    Each 5-minute period has its slot, so an update overwrites the values in
+    place and periods that have passed are skipped when reading.
+    """
+
+    __slots__ = ("summary", "_starts", "_precip", "_snow", "_series")
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.summary: str | None = None
+        self._starts = array("d", [0.0]) * NOWCAST_SLOTS
+        self._precip = array("d", [0.0]) * NOWCAST_SLOTS
+        self._snow = array("b", [0]) * NOWCAST_SLOTS
+        # 当前时段的序号及对应的属性列表,数据或时段变化后重新生成
+        self._series: tuple[int, list[dict]] | None = None
+
+    def update(self, summary: str | None, rows: list[dict]) -> bool:
+        """Store the rows of a minutely forecast, return whether any value changed."""
+        changed = summary != self.summary
+        self.summary = summary
+        for row in rows:
+            start = datetime.fromisoformat(row["fxTime"]).timestamp()
+            slot = int(start // NOWCAST_STEP) % NOWCAST_SLOTS
+            precip = float(row["precip"])
+            snow = row.get("type") == "snow"
+            if self._starts[slot] != start or self._precip[slot] != precip or self._snow[slot] != snow:
+                self._starts[slot] = start
+                self._precip[slot] = precip
+                self._snow[slot] = snow
+                changed = True
+        if changed:
+            self._series = None
+        return changed
+
+    def _upcoming(self, now: float):
+        """Yield the slots from the current period on, in order."""
+        current = int(now // NOWCAST_STEP)
+        for index in range(current, current + NOWCAST_SLOTS):
+            slot = index % NOWCAST_SLOTS
+            start = self._starts[slot]
+            if start > now - NOWCAST_STEP:
+                yield start, self._precip[slot], self._snow[slot]
+
+    def precipitation(self, now: float | None = None) -> float | None:
+        """Return the precipitation expected until the end of the forecast."""
+        values = [precip for _, precip, _ in self._upcoming(time.time() if now is None else now)]
+        return round(sum(values), 2) if values else None
+
+    def minutes_to_precipitation(self, now: float | None = None) -> int | None:
+        """Return the minutes until precipitation starts, 0 when it already has."""
+        if now is None:
+            now = time.time()
+        for start, precip, _ in self._upcoming(now):
+            if precip > 0:
+                return max(round((start - now) / 60), 0)
+        return None
+
+    def series(self, now: float | None = None) -> list[dict]:
+        """Return the forecast from the current period on as a list of dicts."""
+        if now is None:
+            now = time.time()
+        current = int(now // NOWCAST_STEP)
+        if self._series is not None and self._series[0] == current:
+            return self._series[1]
+        series = [
+            {
+                HEWEATHER_DATETIME: datetime.fromtimestamp(start, timezone.utc).isoformat(),
+                HEWEATHER_PRECIPITATION: precip,
+                "type": "snow" if snow else "rain",
+            }
+            for start, precip, snow in self._upcoming(now)
+        ]
+        self._series = (current, series)
+        return series
+
+
+class WarningTracker:
+    """Active weather warnings of a location, diffed between polls."""
+
+    __slots__ = ("warnings", "changes")
+
+    def __init__(self) -> None:
+        """Initialize."""
+        # 预警ID -> 接口返回的预警数据
+        self.warnings: dict[str, dict] = {}
+        # 最近一次更新中新增、更新及解除的预警
+        self.changes: tuple[list[dict], list[dict], list[dict]] = ([], [], [])
+
+    @staticmethod
+    def _revision(warning: dict) -> tuple:
+        return (
+            warning.get("pubTime"),
+            warning.get("status"),
+            warning.get("severity"),
+            warning.get("level"),
+            warning.get("text"),
+        )
+
+    def update(self, rows: list[dict]) -> bool:
+        """Replace the active warnings, return whether any was added, updated or cleared."""
+        previous = self.warnings
+        current = {row["id"]: row for row in rows}
+        new = [row for key, row in current.items() if key not in previous]
+        updated = [
+            row
+            for key, row in current.items()
+            if key in previous and self._revision(row) != self._revision(previous[key])
+        ]
+        cleared = [row for key, row in previous.items() if key not in current]
+        self.warnings = current
+        self.changes = (new, updated, cleared)
+        return bool(new or updated or cleared)
+
+
+class _RollingWindow:
+    """Aggregates of the samples of an ObservationHistory within span seconds.
+
+    Samples are referred to by their sequence number in the history. The
+    minimum and maximum are kept with monotonic queues, so adding and
+    evicting a sample is O(1) amortized.
+    """
+
+    __slots__ = ("span", "start", "end", "temperature_sum", "precipitation", "_min", "_max")
+
+    def __init__(self, span: float) -> None:
+        """Initialize."""
+        self.span = span
+        # 窗口内样本的序号范围[start, end)
+        self.start = 0
+        self.end = 0
+        self.temperature_sum = 0.0
+        self.precipitation = 0.0
+        self._min: deque[int] = deque()
+        self._max: deque[int] = deque()
+
+    def push(self, history: ObservationHistory, seq: int) -> None:
+        """Add the sample seq, the newest of history."""
+        temperature = history.temperature(seq)
+        self.temperature_sum += temperature
+        self.precipitation += history.precipitation(seq)
+        while self._min and history.temperature(self._min[-1]) >= temperature:
+            self._min.pop()
+        self._min.append(seq)
+        while self._max and history.temperature(self._max[-1]) <= temperature:
+            self._max.pop()
+        self._max.append(seq)
+        self.end = seq + 1
+
+    def evict(self, history: ObservationHistory, oldest_seq: int, now: float) -> None:
+        """Drop samples before oldest_seq or older than span seconds."""
+        while self.start < self.end and (
+            self.start < oldest_seq or history.time(self.start) <= now - self.span
+        ):
+            self.temperature_sum -= history.temperature(self.start)
+            self.precipitation -= history.precipitation(self.start)
+            if self._min[0] == self.start:
+                self._min.popleft()
+            if self._max[0] == self.start:
+                self._max.popleft()
+            self.start += 1
+        if self.start == self.end:
+            # 窗口为空时清零,避免浮点误差累积
+            self.temperature_sum = self.precipitation = 0.0
+
+    def as_dict(self, history: ObservationHistory) -> dict:
+        """Return the aggregates."""
+        count = self.end - self.start
+        if not count:
+            return {"samples": 0}
+        return {
+            "samples": count,
+            "temperature_min": round(history.temperature(self._min[0]), 1),
+            "temperature_max": round(history.temperature(self._max[0]), 1),
+            "temperature_mean": round(self.temperature_sum / count, 1),
+            "precipitation": round(max(self.precipitation, 0.0), 1),
+        }
+
+
+class ObservationHistory:
+    """Past observations of a location in a ring buffer of typed arrays.
+
+    Rolling aggregates over each span of HISTORY_WINDOWS are updated as samples
+    arrive. Precipitation is stored as the amount fallen since the previous
+    sample, from the hourly rate the API reports.
+    """
+
+    __slots__ = ("size", "count", "_times", "_temperature", "_humidity", "_pressure", "_precipitation", "windows")
+
+    def __init__(self, size: int = HISTORY_SIZE) -> None:
+        """Initialize."""
+        self.size = size
+        # 已加入的样本总数,序号为seq的样本位于seq % size
+        self.count = 0
+        self._times = array("d", [0.0]) * size
+        self._temperature = array("f", [0.0]) * size
+        self._humidity = array("f", [0.0]) * size
+        self._pressure = array("f", [0.0]) * size
+        self._precipitation = array("f", [0.0]) * size
+        self.windows = {span: _RollingWindow(span) for span in HISTORY_WINDOWS}
+
+    def time(self, seq: int) -> float:
+        """Return the time of sample seq."""
+        return self._times[seq % self.size]
+
+    def temperature(self, seq: int) -> float:
+        """Return the temperature of sample seq."""
+        return self._temperature[seq % self.size]
+
+    def precipitation(self, seq: int) -> float:
+        """Return the precipitation since the sample before seq."""
+        return self._precipitation[seq % self.size]
+
+    def add(self, moment: float, temperature: float, humidity: float, pressure: float, rate: float) -> bool:
+        """Add an observation, return False when it is not newer than the last one."""
+        if self.count:
+            last = self.time(self.count - 1)
+            if moment <= last:
+                return False
+            amount = rate * min(moment - last, 3600) / 3600
+        else:
+            amount = 0.0
+        self._append(moment, temperature, humidity, pressure, amount)
+        return True
+
+    def _append(self, moment: float, temperature: float, humidity: float, pressure: float, amount: float) -> None:
+        seq = self.count
+        # 先移出将被覆盖的样本
+        for window in self.windows.values():
+            window.evict(self, seq - self.size + 1, moment)
+        slot = seq % self.size
+        self._times[slot] = moment
+        self._temperature[slot] = temperature
+        self._humidity[slot] = humidity
+        self._pressure[slot] = pressure
+        self._precipitation[slot] = amount
+        self.count = seq + 1
+        for window in self.windows.values():
+            window.push(self, seq)
+
+    def aggregates(self, span: int, now: float | None = None) -> dict:
+        """Return the aggregates of the last span seconds, span being one of HISTORY_WINDOWS."""
+        window = self.windows[span]
+        window.evict(self, self.count - self.size, time.time() if now is None else now)
+        return window.as_dict(self)
+
+    def as_dict(self) -> dict:
+        """Return the samples as a JSON serializable dict, oldest first."""
+        seqs = range(max(self.count - self.size, 0), self.count)
+        return {
+            "time": [self.time(seq) for seq in seqs],
+            "temperature": [self.temperature(seq) for seq in seqs],
+            "humidity": [self._humidity[seq % self.size] for seq in seqs],
+            "pressure": [self._pressure[seq % self.size] for seq in seqs],
+            "precipitation": [self.precipitation(seq) for seq in seqs],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, size: int = HISTORY_SIZE) -> ObservationHistory:
+        """Create from as_dict() output."""
+        history = cls(size)
+        for sample in zip(
+            data["time"], data["temperature"], data["humidity"], data["pressure"], data["precipitation"]
+        ):
+            history._append(*sample)
+        return history
+
+
+def forecast_endpoint(model: int) -> str:
+    """Return the weather endpoint of a forecast option, e.g. "24h" or "7d"."""
+    # 1为旧配置中的24小时预报
+    if model == 1:
+        return "24h"
+    return f"{model}h" if model in FORECAST_HOURS else f"{model}d"
+
+
+def parse_api_keys(text: str) -> list[str]:
+    """Return the API keys of a comma or whitespace separated string."""
+    return [key for key in re.split(r"[\s,;]+", text) if key]
 
 
 class HeWeather:
     """Main class to perform HeWeather API requests"""
-    def __init__(self, location: str, api_key: str, forcast: str):
+    def __init__(
+        self,
+        fetcher: HeWeatherFetcher,
+        location: str,
+        api_key: str,
+        forcast: int,
+        scan_interval: float,
+        forecast_hourly: int = 0,
+    ):
         # 默认使用公制单位,对于weather实体单位也需设置一致
-        self._urlparams = f'?location={location}&key={api_key}&lang=en'
+        # 所有请求经由全局共享的fetcher,相同地点的请求在各条目间合并
+        self._fetcher = fetcher
+        self._location = snap_location(location)
+        self._api_key = api_key
+        # 缓存有效期略短于刷新间隔,保证定时刷新时总会重新请求
+        self._ttl = max(scan_interval - TIMEOUT, 0)
+        self._forecast_ttl = max(self._ttl, FORECAST_TTL - TIMEOUT)
+        self._air_ttl = max(self._ttl, AIR_TTL - TIMEOUT)
         self._forcast_model = forcast
-        
+        # 额外的逐小时预报时长,0为不获取
+        self._forecast_hourly = forecast_hourly
+
         self.weather_data: dict = {}
 
         self.now_sources: dict = {}
-        self.forecast_sources: list[dict] = []
+        self.air_sources: dict = {}
+        # 分钟级降水预报,由单独的定时任务更新
+        self.nowcast = NowcastBuffer()
+        # 气象预警,由单独的定时任务更新
+        self.warnings = WarningTracker()
+        self._coordinates: str | None = None
+        # 各接口上次解析数据的updateTime
+        self._update_times: dict[str, str] = {}
 
 
     # 连接获取数据
     @classmethod
-    async def _async_get_data(cls, url):
+    async def _async_get_data(
+        cls,
+        session: aiohttp.ClientSession,
+        url,
+        meta: dict | None = None,
+        object_hook=None,
+        timeout: float = TIMEOUT,
+    ):
+        # meta: 传入ETag/Last-Modified用于条件请求(服务器返回304时结果为None),并返回响应字节数
+        headers = {}
+        if meta:
+            if "etag" in meta:
+                headers["If-None-Match"] = meta["etag"]
+            if "last_modified" in meta:
+                headers["If-Modified-Since"] = meta["last_modified"]
         try:
-            async with async_timeout.timeout(TIMEOUT):
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(url) as resp:
-                        _data = await resp.json()
-        except (asyncio.TimeoutError, aiohttp.ClientError) as err:
+            async with async_timeout.timeout(timeout):
+                async with session.get(url, headers=headers) as resp:
+                    if resp.status == 304:
+                        return None
+                    body = await resp.read()
+                    _data = json.loads(body, object_hook=object_hook)
+                    if meta is not None:
+                        meta["bytes"] = len(body)
+                        if "ETag" in resp.headers:
+                            meta["etag"] = resp.headers["ETag"]
+                        if "Last-Modified" in resp.headers:
+                            meta["last_modified"] = resp.headers["Last-Modified"]
+        except (asyncio.TimeoutError, aiohttp.ClientError, ValueError) as err:
             _LOGGER.error("Access to %s error '%s'", url, type(err).__name__)
-            raise ConnectError()
+            raise ConnectError(type(err).__name__)
         else:
             _status_code = int(_data["code"])
             if _status_code != 200:
@@ -74,105 +693,937 @@ class HeWeather:
     
     # 获取城市信息
     @classmethod
-    async def async_get_location(cls, location: str, api_key: str):
+    async def async_get_location(cls, session: aiohttp.ClientSession, location: str, api_key: str):
         """Retreive location data from HeWeather."""
-        try:
+        location = snap_location(location)
+        cities = _LOCATION_CACHE.get((location, api_key))
+        if cities is None:
             url = f'{DEFAULT_LOCATION_API_URL}?location={location}&key={api_key}'
-            data = await cls._async_get_data(url)
-        except Exception as e:
-            raise e
-        else:
-            citylist = dict()
-            for city in data["location"]:
-                citylist[city["id"]] = f'{city["name"]}-{city["adm2"]}-{city["adm1"]}'
-            return citylist
+            data = await cls._async_get_data(session, url)
+            cities = data["location"]
+            _LOCATION_CACHE.set((location, api_key), cities)
+        citylist = dict()
+        for city in cities:
+            citylist[city["id"]] = f'{city["name"]}-{city["adm2"]}-{city["adm1"]}'
+        return citylist
 
 
     # 获取使用的KEY权限
+    # endpoint: 用于探测权限的预报接口,默认24h;更长的预报需另行探测
     @classmethod
-    async def async_get_key_permission(cls, location: str, api_key: str):
+    async def async_get_key_permission(
+        cls,
+        session: aiohttp.ClientSession,
+        location: str,
+        api_key: str,
+        fetcher: HeWeatherFetcher | None = None,
+        endpoint: str = "24h",
+    ):
         """Retreive key permission from HeWeather."""
+        # 权限只与KEY有关,结果在各配置流程间共享
+        permission = _PERMISSION_CACHE.get((api_key, endpoint))
+        if permission is not None:
+            return permission
+        if fetcher is not None:
+            try:
+                # 条目已缓存该接口的数据时KEY必有权限,无需请求
+                await fetcher.async_get(
+                    DEFAULT_WEATHER_API_URL + endpoint, snap_location(location), api_key, cache_only=True
+                )
+            except ConnectError:
+                pass
+            else:
+                _PERMISSION_CACHE.set((api_key, endpoint), True)
+                return True
+        # 直接请求而不经由fetcher: 请求不被shield,取消探测即中断下载
+        url = f'{DEFAULT_WEATHER_API_URL}{endpoint}?location={location}&key={api_key}'
         try:
-            url = f'{DEFAULT_WEATHER_API_URL}24h?location={location}&key={api_key}'
-            await cls._async_get_data(url)
-        except:
+            status = await cls._async_get_status(session, url)
+        except ConnectError:
+            # 网络错误时不缓存结果
             return False
-        else:
-            return True
+        permission = status == 200
+        # 只缓存确定的结果,超过访问频率等临时错误下次重新探测
+        if permission or 401 <= status <= 403:
+            _PERMISSION_CACHE.set((api_key, endpoint), permission)
+        return permission
+
+    @classmethod
+    async def _async_get_status(cls, session: aiohttp.ClientSession, url: str) -> int:
+        # 只读取到响应开头的"code"字段即断开连接,不下载及解析整个预报
+        head = b""
+        match = None
+        try:
+            async with async_timeout.timeout(TIMEOUT):
+                async with session.get(url) as resp:
+                    while match is None and len(head) < PROBE_MAX_BYTES:
+                        chunk = await resp.content.read(PROBE_MAX_BYTES)
+                        if not chunk:
+                            break
+                        head += chunk
+                        match = _CODE_RE.search(head)
+        except (asyncio.TimeoutError, aiohttp.ClientError) as err:
+            _LOGGER.error("Access to %s error '%s'", url, type(err).__name__)
+            raise ConnectError(type(err).__name__)
+        if match is None:
+            raise ConnectError("ValueError")
+        return int(match.group(1))
+
+
+    # 返回接口数据,数据与上次解析时相同(updateTime未变)则返回None
+    async def _async_get(
+        self,
+        endpoint: str,
+        cache_only: bool = False,
+        ttl: float | None = None,
+        object_hook=None,
+        location: str | None = None,
+    ):
+        resp = await self._fetcher.async_get(
+            endpoint,
+            location or self._location,
+            self._api_key,
+            ttl=self._ttl if ttl is None else ttl,
+            cache_only=cache_only,
+            object_hook=object_hook,
+        )
+        update_time = resp.get("updateTime")
+        if update_time is not None and self._update_times.get(endpoint) == update_time:
+            return None
+        return resp
 
 
     # 更新天气预报数据
-    async def async_fetch_data(self):
-        await self._async_get_now()
-        if self._forcast_model == 1:
-            await self._async_get_forecast24h()
-        else:
-            await self._async_get_forecast(self._forcast_model)
+    # cache_only: 仅使用缓存数据,用于启动时快速恢复
+    # 返回数据是否有变化
+    async def async_fetch_data(self, cache_only: bool = False) -> bool:
+        # 各接口互不依赖,并发请求;单个接口失败不影响其他接口的数据
+        start = time.monotonic()
+        updates = [
+            self._async_update(DEFAULT_WEATHER_API_URL + "now", self._parse_now, cache_only),
+            self._async_update(DEFAULT_AIRQUALITY_API_URL, self._parse_air, cache_only, self._air_ttl),
+        ]
+        endpoint = forecast_endpoint(self._forcast_model)
+        keys = (HEWEATHER_FORECAST,)
+        if self._forecast_hourly:
+            hourly = forecast_endpoint(self._forecast_hourly)
+            if hourly == endpoint:
+                # 与主预报为同一接口时只请求一次
+                keys = (HEWEATHER_FORECAST, HEWEATHER_FORECAST_HOURLY)
+            else:
+                updates.append(self._async_update_forecast(hourly, (HEWEATHER_FORECAST_HOURLY,), cache_only))
+        updates.append(self._async_update_forecast(endpoint, keys, cache_only))
+        changed = await asyncio.gather(*updates)
+        _LOGGER.debug("Fetched weather data in %.3f seconds", time.monotonic() - start)
+        return any(changed)
 
 
-    # 获取当前天气
-    async def _async_get_now(self):
-        try:
-            resp = await self._async_get_data(DEFAULT_WEATHER_API_URL + "now" + self._urlparams)
-        except Exception as e:
-            pass
+    # 获取预报数据并解析为keys中的各项
+    def _async_update_forecast(self, endpoint: str, keys: tuple[str, ...], cache_only: bool):
+        if endpoint.endswith("h"):
+            parse, object_hook = partial(self._parse_hourly, keys), ForecastRow.decode_hourly
         else:
-            self.now_sources = resp['now']
-            self.weather_data[HEWEATHER_TEMPERATURE] = float(self.now_sources.get("temp"))
-            self.weather_data[HEWEATHER_HUMIDITY] = float(self.now_sources.get("humidity"))
-            self.weather_data[HEWEATHER_PRESSURE] = float(self.now_sources.get("pressure"))
-            self.weather_data[HEWEATHER_CONDITION] = format_condition(self.now_sources.get("text"))
-            self.weather_data[HEWEATHER_VISIBILITY] = float(self.now_sources.get("vis"))
-            self.weather_data[HEWEATHER_WIND_BEARING] = float(self.now_sources.get("wind360"))
-            self.weather_data[HEWEATHER_WIND_SPEED] = float(self.now_sources.get("windSpeed"))
-
+            parse, object_hook = partial(self._parse_daily, keys), ForecastRow.decode_daily
+        return self._async_update(
+            DEFAULT_WEATHER_API_URL + endpoint, parse, cache_only, self._forecast_ttl, object_hook
+        )
 
 
-    # 获取24h天气预报
-    async def _async_get_forecast24h(self):
+    # 获取接口数据并解析,返回数据是否有变化
+    # 解析函数返回False时表示数据虽有更新,但数值未变化
+    async def _async_update(
+        self,
+        endpoint: str,
+        parse,
+        cache_only: bool,
+        ttl: float | None = None,
+        object_hook=None,
+        location: str | None = None,
+    ) -> bool:
         try:
-            resp = await self._async_get_data(DEFAULT_WEATHER_API_URL +"24h"+ self._urlparams)
+            resp = await self._async_get(endpoint, cache_only, ttl, object_hook, location)
         except Exception:
-            pass
-        else:
-            self.weather_data[HEWEATHER_FORECAST] = []
-            self.forecast_sources = resp['hourly']
-            for hourly_data in self.forecast_sources:
-                timeseries = dict()
-                timeseries[HEWEATHER_DATETIME] = hourly_data["fxTime"]
-                timeseries[HEWEATHER_CONDITION] = format_condition(hourly_data["text"])
-                timeseries[HEWEATHER_TEMPERATURE] = float(hourly_data["temp"])
-                timeseries[HEWEATHER_PRESSURE] = float(hourly_data["pressure"])
-                timeseries[HEWEATHER_PRECIPITATION] = float(hourly_data["precip"])
-                timeseries[HEWEATHER_WIND_BEARING] = float(hourly_data["wind360"])
-                timeseries[HEWEATHER_WIND_SPEED] = float(hourly_data["windSpeed"])
-                if hourly_data.get("pop", None):
-                    timeseries[HEWEATHER_PRECIPITATION_PROBABILITY] = int(hourly_data["pop"])
-
-                self.weather_data[HEWEATHER_FORECAST].append(timeseries)
-
-
-    # 获取未来天气预报
-    async def _async_get_forecast(self, day:str):
+            return False
+        if resp is None:
+            return False
+        start = time.perf_counter()
+        changed = parse(resp)
+        self._fetcher.record_parse(endpoint, location or self._location, time.perf_counter() - start)
+        # 解析成功后才记录updateTime,解析出错时下次仍重新解析
+        self._update_times[endpoint] = resp.get("updateTime")
+        return changed is not False
+
+
+    # 更新分钟级降水预报,与天气数据分开更新
+    # 返回数据是否有变化
+    async def async_fetch_nowcast(self, ttl: float = 0, cache_only: bool = False) -> bool:
         try:
-            resp = await self._async_get_data(f'{DEFAULT_WEATHER_API_URL}{day}d{self._urlparams}')
+            location = await self._async_get_coordinates(cache_only)
         except Exception:
-            pass
+            return False
+        return await self._async_update(
+            DEFAULT_MINUTELY_API_URL, self._parse_nowcast, cache_only, ttl, location=location
+        )
+
+
+    # 更新气象预警,与天气数据分开更新
+    # 返回是否有预警新增、更新或解除
+    async def async_fetch_warnings(self, ttl: float = 0, cache_only: bool = False) -> bool:
+        return await self._async_update(DEFAULT_WARNING_API_URL, self._parse_warnings, cache_only, ttl)
+
+
+    # 分钟级预报只支持经纬度,LocationID经由城市查询(带缓存)转换
+    async def _async_get_coordinates(self, cache_only: bool = False) -> str:
+        if self._coordinates is None:
+            if _COORDINATES.match(self._location):
+                self._coordinates = self._location
+            else:
+                resp = await self._fetcher.async_get(
+                    DEFAULT_LOCATION_API_URL,
+                    self._location,
+                    self._api_key,
+                    ttl=LOCATION_CACHE_TTL,
+                    cache_only=cache_only,
+                )
+                city = resp["location"][0]
+                self._coordinates = snap_location(f'{city["lon"]},{city["lat"]}')
+        return self._coordinates
+
+
+    # 当前天气
+    def _parse_now(self, resp: dict):
+        self.now_sources = resp['now']
+        self.weather_data[HEWEATHER_TEMPERATURE] = float(self.now_sources.get("temp"))
+        self.weather_data[HEWEATHER_HUMIDITY] = float(self.now_sources.get("humidity"))
+        self.weather_data[HEWEATHER_PRESSURE] = float(self.now_sources.get("pressure"))
+        self.weather_data[HEWEATHER_CONDITION] = format_condition(self.now_sources.get("text"), self.now_sources.get("icon"))
+        self.weather_data[HEWEATHER_VISIBILITY] = float(self.now_sources.get("vis"))
+        self.weather_data[HEWEATHER_WIND_BEARING] = float(self.now_sources.get("wind360"))
+        self.weather_data[HEWEATHER_WIND_SPEED] = float(self.now_sources.get("windSpeed"))
+        # 派生数据在此计算一次,各传感器直接读取;接口未返回时为None或按公式计算
+        feels_like = self.now_sources.get("feelsLike")
+        self.weather_data[HEWEATHER_APPARENT_TEMPERATURE] = float(feels_like) if feels_like else None
+        dew = self.now_sources.get("dew")
+        self.weather_data[HEWEATHER_DEW_POINT] = (
+            float(dew)
+            if dew
+            else dew_point(self.weather_data[HEWEATHER_TEMPERATURE], self.weather_data[HEWEATHER_HUMIDITY])
+        )
+        cloud = self.now_sources.get("cloud")
+        self.weather_data[HEWEATHER_CLOUD] = float(cloud) if cloud else None
+        self._fetcher.record_observation(self._location, self.now_sources)
+
+
+    # 空气质量
+    def _parse_air(self, resp: dict):
+        self.air_sources = resp['now']
+        self.weather_data[HEWEATHER_AQI] = float(self.air_sources.get("aqi"))
+        self.weather_data[HEWEATHER_PM25] = float(self.air_sources.get("pm2p5"))
+        self.weather_data[HEWEATHER_OZONE] = float(self.air_sources.get("o3"))
+
+
+    # 分钟级降水预报
+    def _parse_nowcast(self, resp: dict) -> bool:
+        return self.nowcast.update(resp.get("summary"), resp["minutely"])
+
+
+    # 气象预警
+    def _parse_warnings(self, resp: dict) -> bool:
+        return self.warnings.update(resp.get("warning", []))
+
+
+    # 逐小时天气预报
+    def _parse_hourly(self, keys: tuple[str, ...], resp: dict):
+        series = ForecastSeries(tuple(ForecastRow.from_hourly(hourly_data) for hourly_data in resp['hourly']))
+        for key in keys:
+            self.weather_data[key] = series
+
+
+    # 逐天天气预报
+    def _parse_daily(self, keys: tuple[str, ...], resp: dict):
+        series = ForecastSeries(
+            tuple(ForecastRow.from_daily(daily_data) for daily_data in resp['daily']),
+            # updateTime带有该地点的UTC偏移
+            datetime.fromisoformat(resp['updateTime']).tzinfo,
+        )
+        for key in keys:
+            self.weather_data[key] = series
+
+
+    # 实况观测历史,与相同地点的其他条目共享
+    @property
+    def history(self) -> ObservationHistory:
+        """Return the observation history of this location."""
+        return self._fetcher.history(self._location)
+
+
+    # 请求统计,用于诊断
+    def diagnostics(self) -> dict:
+        """Return request statistics of this location and API key."""
+        return self._fetcher.diagnostics(self._location, self._api_key)
+
+
+
+class _RequestSchedule:
+    """Polling state of one (location, endpoint, lang) request."""
+
+    __slots__ = ("update_time", "changed_at", "period", "failures", "retry_at")
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.update_time: str | None = None
+        # 上次观察到updateTime变化的时间,及变化周期的估计值(秒)
+        self.changed_at: float | None = None
+        self.period: float | None = None
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def observe(self, data: dict, now: float) -> None:
+        """Record a successful response."""
+        self.failures = 0
+        self.retry_at = 0.0
+        update_time = data.get("updateTime")
+        if update_time == self.update_time:
+            return
+        if self.changed_at is not None:
+            interval = now - self.changed_at
+            self.period = interval if self.period is None else (self.period + interval) / 2
+        self.update_time = update_time
+        self.changed_at = now
+
+    def fail(self, now: float) -> None:
+        """Record a failed request and back off exponentially."""
+        self.failures += 1
+        self.retry_at = now + min(BACKOFF_BASE * 2 ** (self.failures - 1), BACKOFF_MAX)
+
+    def ttl(self, ttl: float) -> float:
+        """Return how long a response stays fresh, given the caller's ttl."""
+        # 接口数据更新越慢,请求越少;至多每个变化周期请求两次
+        if self.period is not None:
+            ttl = max(ttl, min(self.period / 2, ADAPTIVE_MAX_TTL))
+        return ttl
+
+
+class _RequestStats:
+    """Counters of one (location, endpoint, lang) request, for diagnostics."""
+
+    __slots__ = (
+        "requests",
+        "cache_hits",
+        "stale",
+        "timeouts",
+        "retries",
+        "hedges",
+        "short_circuits",
+        "failovers",
+        "errors",
+        "bytes",
+        "latencies",
+        "parses",
+        "parse_time",
+    )
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.requests = 0
+        self.cache_hits = 0
+        self.stale = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.hedges = 0
+        self.short_circuits = 0
+        self.failovers = 0
+        self.errors: dict[str, int] = {}
+        self.bytes = 0
+        # 最近的请求耗时(秒),用于计算分位数
+        self.latencies: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.parses = 0
+        self.parse_time = 0.0
+
+    def as_dict(self) -> dict:
+        """Return the counters as a JSON serializable dict."""
+        latencies = sorted(self.latencies)
+        lookups = self.requests + self.cache_hits
+        return {
+            "requests": self.requests,
+            "cache_hits": self.cache_hits,
+            "cache_hit_ratio": round(self.cache_hits / lookups, 3) if lookups else None,
+            "stale_responses": self.stale,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "hedged_requests": self.hedges,
+            "short_circuits": self.short_circuits,
+            "key_failovers": self.failovers,
+            "errors": dict(self.errors),
+            "bytes_received": self.bytes,
+            "latency_p50": _percentile(latencies, 0.50),
+            "latency_p95": _percentile(latencies, 0.95),
+            "latency_p99": _percentile(latencies, 0.99),
+            "parse_time_avg": round(self.parse_time / self.parses, 6) if self.parses else None,
+        }
+
+
+def _percentile(values: list[float], fraction: float) -> float | None:
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * fraction))], 3)
+
+
+class _TokenBucket:
+    """Rate limiter allowing rate requests per second with bursts of burst."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: int) -> None:
+        """Initialize."""
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def try_acquire(self) -> bool:
+        """Take a token if one is available now."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    async def async_acquire(self, deadline: float | None = None) -> bool:
+        """Wait until a request may be sent, return False when that is after deadline."""
+        while not self.try_acquire():
+            wait = (1 - self.tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+        return True
+
+
+class _CircuitBreaker:
+    """Consecutive connection failures of one API host."""
+
+    __slots__ = ("failures", "open_until", "succeeded_at")
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.failures = 0
+        self.open_until = 0.0
+        self.succeeded_at = 0.0
+
+    def allow(self, now: float) -> bool:
+        """Return whether a request may be sent now."""
+        if self.failures < BREAKER_THRESHOLD:
+            return True
+        if now < self.open_until:
+            return False
+        # 半开:放行一个探测请求,冷却期内其余请求仍被拦截
+        self.open_until = now + BREAKER_COOLDOWN
+        return True
+
+    def is_open(self, now: float) -> bool:
+        """Return whether requests to the host are held back."""
+        return self.failures >= BREAKER_THRESHOLD and now < self.open_until
+
+    def success(self, now: float) -> None:
+        """Record a response from the host."""
+        self.failures = 0
+        self.succeeded_at = now
+
+    def failure(self, now: float, started: float) -> None:
+        """Record a failed connection to the host of an attempt sent at started."""
+        # 在最近一次成功之前发出的请求(如同时超时的多个请求)不算作连续失败
+        if started < self.succeeded_at:
+            return
+        self.failures += 1
+        if self.failures >= BREAKER_THRESHOLD:
+            self.open_until = now + BREAKER_COOLDOWN
+
+
+class HeWeatherFetcher:
+    """Request layer shared by all HeWeather config entries.
+
+    Identical requests, keyed by (location, endpoint, lang), that are issued while
+    one is already in flight are coalesced into a single HTTP call whose result is
+    handed to every caller. Responses are kept in a cache that is persisted with
+    the given store, so entries can start from it and fall back to it when the
+    API is unreachable.
+
+    How long a response stays fresh adapts to how often its updateTime changes and
+    is stretched so that all requests made with an API key fit its daily quota.
+    Failing requests are retried with exponential backoff. Requests going to the
+    network are capped at MAX_CONCURRENT_REQUESTS and spread out by a token bucket
+    per API key, so a large number of entries does not hit the API in bursts.
+
+    Each request is made of attempts with their own ATTEMPT_TIMEOUT, retried with
+    jitter within the overall TIMEOUT. A host that keeps failing trips a circuit
+    breaker and requests to it are answered from the cache until it recovers.
+    With hedge, or while an entry enables it with set_hedge, a second attempt is
+    sent when the first one is slower than the usual latency of the endpoint,
+    and the first response wins.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        store=None,
+        hedge: bool = False,
+        history_store=None,
+    ) -> None:
+        """Initialize."""
+        # 复用HA共享的长连接会话(keep-alive/连接池/DNS缓存),由HA负责关闭
+        self._session = session
+        self._store = store
+        self._load_task: asyncio.Future | None = None
+        self._inflight: dict[tuple[str, str, str], asyncio.Future] = {}
+        self._schedules: dict[tuple[str, str, str], _RequestSchedule] = {}
+        self._stats: dict[tuple[str, str, str], _RequestStats] = {}
+        self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        self._buckets: dict[str, _TokenBucket] = {}
+        self._breakers: dict[str, _CircuitBreaker] = {}
+        self._hedge = hedge
+        # 启用对冲请求的条目
+        self._hedge_owners: set[str] = set()
+        # 每个KEY的每日请求额度及近24小时的请求时间
+        self._quotas: dict[str, int] = {}
+        self._usage: dict[str, deque[float]] = {}
+        # KEY池: KEY -> 引用的条目数;暂停使用的KEY: (KEY, 接口或None) -> 恢复时间
+        self._keys: dict[str, int] = {}
+        self._ejected: dict[tuple[str, str | None], float] = {}
+        # 各请求的期望有效期及最近请求时间,池中所有KEY共同承担
+        self._demand: dict[tuple[str, str, str], tuple[float, float]] = {}
+        # 缓存: "location|endpoint|lang" -> {"time": 获取时间戳, "ttl": 有效期(秒), "data": 原始数据}
+        self.cache: dict[str, dict] = {}
+        # 各地点的实况观测历史,与缓存分开保存
+        self._history_store = history_store
+        self.histories: dict[str, ObservationHistory] = {}
+        # 使用该fetcher的配置条目数量,归零时由调用方销毁
+        self.refcount = 0
+
+    async def async_load(self) -> None:
+        """Load the persisted response cache, once."""
+        if self._store is None:
+            return
+        if self._load_task is None:
+            self._load_task = asyncio.ensure_future(self._async_load())
+        await asyncio.shield(self._load_task)
+
+    async def _async_load(self) -> None:
+        data = await self._store.async_load()
+        if data:
+            self.cache = self._prune(data)
+        if self._history_store is not None:
+            data = await self._history_store.async_load()
+            if data:
+                self.histories = {
+                    location: ObservationHistory.from_dict(samples) for location, samples in data.items()
+                }
+
+    async def async_save(self) -> None:
+        """Write the response cache and the histories to disk now, replacing pending delayed writes."""
+        if self._store is not None:
+            await self._store.async_save(self._data_to_save())
+        if self._history_store is not None and self.histories:
+            await self._history_store.async_save(self._history_to_save())
+
+    def _prune(self, cache: dict[str, dict]) -> dict[str, dict]:
+        now = time.time()
+        return {key: entry for key, entry in cache.items() if now - entry["time"] < CACHE_MAX_AGE}
+
+    def set_quota(self, api_key: str, quota: int) -> None:
+        """Set the daily request budget shared by all entries using api_key."""
+        self._quotas[api_key] = quota
+
+    def _quota_used(self, api_key: str, now: float) -> int:
+        usage = self._usage.setdefault(api_key, deque())
+        while usage and now - usage[0] >= 86400:
+            usage.popleft()
+        return len(usage)
+
+    def _record_usage(self, api_key: str, now: float) -> None:
+        self._usage.setdefault(api_key, deque()).append(now)
+
+    def set_hedge(self, owner: str, enabled: bool) -> None:
+        """Enable hedged requests for as long as any owner asks for them."""
+        if enabled:
+            self._hedge_owners.add(owner)
         else:
-            self.weather_data[HEWEATHER_FORECAST] = []
-            self.forecast_sources = resp['daily']
-            for daily_data in self.forecast_sources:
-                dateseries = dict()
-                dateseries[HEWEATHER_DATETIME] = daily_data["fxDate"]
-                dateseries[HEWEATHER_CONDITION] = format_condition(daily_data["textDay"])
-                dateseries[HEWEATHER_TEMPERATURE] = float(daily_data["tempMax"])
-                dateseries[HEWEATHER_TEMP_LOW] = float(daily_data["tempMin"])
-                dateseries[HEWEATHER_PRESSURE] = float(daily_data["pressure"])
-                dateseries[HEWEATHER_PRECIPITATION] = float(daily_data["precip"])
-                dateseries[HEWEATHER_WIND_BEARING] = float(daily_data["wind360Day"])
-                dateseries[HEWEATHER_WIND_SPEED] = float(daily_data["windSpeedDay"])
-
-                self.weather_data[HEWEATHER_FORECAST].append(dateseries)
+            self._hedge_owners.discard(owner)
+
+    def add_keys(self, api_keys: Iterable[str]) -> None:
+        """Add API keys to the pool shared by all entries."""
+        for api_key in api_keys:
+            self._keys[api_key] = self._keys.get(api_key, 0) + 1
+
+    def remove_keys(self, api_keys: Iterable[str]) -> None:
+        """Drop the references to API keys added with add_keys."""
+        for api_key in api_keys:
+            count = self._keys.get(api_key, 0) - 1
+            if count > 0:
+                self._keys[api_key] = count
+            else:
+                self._keys.pop(api_key, None)
+
+    def _pool(self, api_key: str) -> list[str]:
+        # 条目自身的KEY排在最前,用量相同时优先使用
+        return [api_key, *(key for key in self._keys if key != api_key)]
+
+    def _pool_quota(self, api_key: str) -> int:
+        quotas = [self._quotas.get(key) for key in self._pool(api_key)]
+        # 任一KEY不限额度时整个池不限制
+        return sum(quotas) if all(quotas) else 0
+
+    def _ejected_until(self, api_key: str, endpoint: str, now: float) -> float:
+        until = 0.0
+        for scope in (None, endpoint):
+            value = self._ejected.get((api_key, scope))
+            if value is None:
+                continue
+            if now >= value:
+                del self._ejected[(api_key, scope)]
+            else:
+                until = max(until, value)
+        return until
+
+    def _eject(self, api_key: str, endpoint: str, code: int, now: float) -> None:
+        scope = endpoint if code == 403 else None
+        self._ejected[(api_key, scope)] = now + KEY_EJECT_TIMES[code]
+        _LOGGER.warning(
+            "API key ...%s returned %s, not using it for %s seconds",
+            api_key[-4:],
+            code,
+            KEY_EJECT_TIMES[code],
+        )
+
+    def _select_key(
+        self, api_key: str, endpoint: str, now: float, exclude: Iterable[str] = ()
+    ) -> str | None:
+        """Return the usable key of the pool with the lowest share of its quota used."""
+        best = None
+        best_load = None
+        for candidate in self._pool(api_key):
+            if candidate in exclude or self._ejected_until(candidate, endpoint, now):
+                continue
+            used = self._quota_used(candidate, now)
+            quota = self._quotas.get(candidate)
+            if quota and used >= quota:
+                continue
+            # 按额度加权:用量占额度比例最低者优先,不限额度的KEY按请求数
+            load = (used / quota if quota else 0.0, used)
+            if best_load is None or load < best_load:
+                best, best_load = candidate, load
+        return best
+
+    def history(self, location: str) -> ObservationHistory:
+        """Return the observation history of location."""
+        history = self.histories.get(location)
+        if history is None:
+            history = self.histories[location] = ObservationHistory()
+        return history
+
+    def record_observation(self, location: str, now: dict) -> None:
+        """Add a /weather/now observation to the history of location."""
+        # 相同地点的多个条目会记录同一观测,history按时间去重
+        added = self.history(location).add(
+            datetime.fromisoformat(now["obsTime"]).timestamp(),
+            float(now["temp"]),
+            float(now["humidity"]),
+            float(now["pressure"]),
+            float(now["precip"]),
+        )
+        if added and self._history_store is not None:
+            self._history_store.async_delay_save(self._history_to_save, HISTORY_SAVE_DELAY)
+
+    def _history_to_save(self) -> dict[str, dict]:
+        return {location: history.as_dict() for location, history in self.histories.items()}
+
+    def record_parse(self, endpoint: str, location: str, seconds: float, lang: str = "en") -> None:
+        """Record the time an entry spent parsing a payload."""
+        stats = self._stats.setdefault((location, endpoint, lang), _RequestStats())
+        stats.parses += 1
+        stats.parse_time += seconds
+
+    def diagnostics(self, location: str, api_key: str) -> dict:
+        """Return request statistics of a location and the usage of its key pool."""
+        now = time.time()
+        pool = self._pool(api_key)
+        return {
+            "quota": {
+                "used": sum(self._quota_used(key, now) for key in pool),
+                "limit": self._pool_quota(api_key) or None,
+            },
+            # 只显示KEY的末4位
+            "keys": [
+                {
+                    "key": f"...{key[-4:]}",
+                    "used": self._quota_used(key, now),
+                    "limit": self._quotas.get(key) or None,
+                    "ejected": any(
+                        scope_key == key and until > now
+                        for (scope_key, _), until in self._ejected.items()
+                    ),
+                }
+                for key in pool
+            ],
+            "endpoints": {
+                key[1].split("/", 3)[-1]: stats.as_dict()
+                for key, stats in self._stats.items()
+                if key[0] == location
+            },
+            "hosts": {
+                host: {"failures": breaker.failures, "open": breaker.is_open(time.time())}
+                for host, breaker in self._breakers.items()
+            },
+        }
+
+    def _ttl(self, key: tuple[str, str, str], api_key: str, ttl: float) -> float:
+        schedule = self._schedules.setdefault(key, _RequestSchedule())
+        now = time.time()
+        ttl = max(schedule.ttl(ttl), 1)
+        self._demand[key] = (ttl, now)
+        quota = self._pool_quota(api_key)
+        if not quota:
+            return ttl
+        # 超过DEMAND_IDLE_FACTOR倍有效期未再请求的(条目已卸载或关闭了该数据)不再计入
+        self._demand = {
+            demand_key: demand
+            for demand_key, demand in self._demand.items()
+            if now - demand[1] <= demand[0] * DEMAND_IDLE_FACTOR
+        }
+        # 按当前频率每天的请求数超出整个KEY池的额度时,所有请求按比例放慢
+        requests_per_day = sum(86400 / demand[0] for demand in self._demand.values())
+        return ttl * max(requests_per_day / quota, 1)
+
+    async def async_get(
+        self,
+        endpoint: str,
+        location: str,
+        api_key: str,
+        lang: str = "en",
+        ttl: float = 0,
+        cache_only: bool = False,
+        object_hook=None,
+    ) -> dict:
+        """Return the payload of endpoint for location.
+
+        A cached payload that is still fresh is returned without a request, and a
+        stale one is returned when the request fails or is held back. With
+        cache_only the cached payload is returned whatever its age. object_hook is
+        passed to the JSON decoder of the response.
+        """
+        key = (location, endpoint, lang)
+        cached = self.cache.get("|".join(key))
+        if cache_only:
+            if cached is None:
+                raise ConnectError()
+            return cached["data"]
+
+        now = time.time()
+        ttl = self._ttl(key, api_key, ttl)
+        stats = self._stats.setdefault(key, _RequestStats())
+        if cached is not None and now - cached["time"] < ttl:
+            stats.cache_hits += 1
+            return cached["data"]
+
+        if now < self._schedules[key].retry_at or self._select_key(api_key, endpoint, now) is None:
+            # 退避中,或池中所有KEY已用完当日额度或暂停使用,不发起请求
+            return self._stale(key, cached, ConnectError())
+
+        task = self._inflight.get(key)
+        if task is None:
+            if self._breaker(endpoint).is_open(now):
+                # 熔断中直接使用缓存数据,不排队等待并发名额及令牌
+                stats.short_circuits += 1
+                return self._stale(key, cached, ConnectError("CircuitOpen"))
+            task = asyncio.ensure_future(self._async_request(key, api_key, ttl, object_hook))
+            task.add_done_callback(partial(self._async_request_done, key))
+            self._inflight[key] = task
+        try:
+            # shield: 某个订阅者被取消时不影响其他等待同一请求的条目;
+            # 排队时间也计入TIMEOUT,超时后请求在后台继续,完成后写入缓存
+            return await asyncio.wait_for(asyncio.shield(task), TIMEOUT)
+        except asyncio.TimeoutError:
+            return self._stale(key, cached, ConnectError("TimeoutError"))
+        except (ConnectError, ApiParamError) as err:
+            return self._stale(key, cached, err)
+
+    def _breaker(self, endpoint: str) -> _CircuitBreaker:
+        return self._breakers.setdefault(urlsplit(endpoint).netloc, _CircuitBreaker())
+
+    def _stale(self, key: tuple[str, str, str], cached: dict | None, err: Exception) -> dict:
+        # 接口不可用时使用未过期太久的旧数据
+        if cached is not None and time.time() - cached["time"] < CACHE_MAX_AGE:
+            _LOGGER.debug("Using cached %s data for %s", key[1], key[0])
+            self._stats[key].stale += 1
+            return cached["data"]
+        raise err
+
+    async def _async_request(
+        self, key: tuple[str, str, str], api_key: str, ttl: float, object_hook=None
+    ) -> dict:
+        # 总时长从排队开始计算,包括等待并发名额及令牌的时间
+        deadline = time.monotonic() + TIMEOUT
+        async with self._semaphore:
+            if deadline - time.monotonic() < ATTEMPT_MIN_TIMEOUT:
+                # 排队耗尽了总时长,不发起注定超时的请求,也不计为服务器故障
+                raise ConnectError("Throttled")
+            if self._breaker(key[1]).is_open(time.time()):
+                # 排队期间已熔断
+                self._stats[key].short_circuits += 1
+                raise ConnectError("CircuitOpen")
+            # 等待并发名额期间KEY的状态可能已变化,此时再选择KEY
+            selected = self._select_key(api_key, key[1], time.time())
+            if selected is None:
+                raise ConnectError("NoApiKey")
+            return await self._async_send(key, selected, ttl, object_hook, deadline)
+
+    def _bucket(self, api_key: str) -> _TokenBucket:
+        bucket = self._buckets.get(api_key)
+        if bucket is None:
+            bucket = self._buckets[api_key] = _TokenBucket(RATE_LIMIT, RATE_BURST)
+        return bucket
+
+    @staticmethod
+    def _url(key: tuple[str, str, str], api_key: str) -> str:
+        location, endpoint, lang = key
+        return f'{endpoint}?location={location}&key={api_key}&lang={lang}'
+
+    async def _async_send(
+        self, key: tuple[str, str, str], api_key: str, ttl: float, object_hook=None, deadline: float = 0
+    ) -> dict:
+        cache_key = "|".join(key)
+        cached = self.cache.get(cache_key)
+        meta = dict(cached.get("validators", {})) if cached else {}
+        schedule = self._schedules[key]
+        stats = self._stats[key]
+        breaker = self._breaker(key[1])
+        deadline = deadline or time.monotonic() + TIMEOUT
+        attempt = 0
+        tried: set[str] = set()
+        while True:
+            if not breaker.allow(time.time()):
+                # 熔断中不发起请求,由调用方使用缓存数据
+                stats.short_circuits += 1
+                raise ConnectError("CircuitOpen")
+            # 每次尝试(包括重试及换用KEY)都消耗所用KEY的令牌
+            if not await self._bucket(api_key).async_acquire(deadline - ATTEMPT_MIN_TIMEOUT):
+                # 剩余时间不足一次尝试
+                raise ConnectError("Throttled")
+            url = self._url(key, api_key)
+            self._record_usage(api_key, time.time())
+            stats.requests += 1
+            started = time.time()
+            start = time.monotonic()
+            try:
+                data = await self._async_attempt(
+                    key, api_key, url, meta, object_hook, min(ATTEMPT_TIMEOUT, deadline - start)
+                )
+            except (ConnectError, InvalidApiKeyError, ApiParamError) as err:
+                # 失败及超时的耗时不计入分位数,避免对冲延迟被拉长到ATTEMPT_TIMEOUT
+                name = type(err).__name__
+                stats.errors[name] = stats.errors.get(name, 0) + 1
+                if isinstance(err, ConnectError):
+                    if err.status == "TimeoutError":
+                        stats.timeouts += 1
+                    breaker.failure(time.time(), started)
+                    # 在总时长内随机等待后重试,避免各条目同时重试
+                    delay = random.uniform(0, RETRY_BACKOFF * 2 ** attempt)
+                    if attempt < RETRIES and deadline - time.monotonic() - delay >= ATTEMPT_MIN_TIMEOUT:
+                        attempt += 1
+                        stats.retries += 1
+                        # 等待重试期间让出并发名额
+                        self._semaphore.release()
+                        try:
+                            await asyncio.sleep(delay)
+                        finally:
+                            await self._semaphore.acquire()
+                        continue
+                else:
+                    # 接口返回了错误码,服务器本身可用
+                    breaker.success(time.time())
+                    if err.error_code in KEY_EJECT_TIMES:
+                        # KEY不可用:暂停使用,立即换用池中的其他KEY
+                        now = time.time()
+                        self._eject(api_key, key[1], err.error_code, now)
+                        tried.add(api_key)
+                        selected = self._select_key(api_key, key[1], now, tried)
+                        if selected is not None and deadline - time.monotonic() >= ATTEMPT_MIN_TIMEOUT:
+                            stats.failovers += 1
+                            api_key = selected
+                            continue
+                if not isinstance(err, InvalidApiKeyError):
+                    schedule.fail(time.time())
+                raise
+            break
+        breaker.success(time.time())
+        stats.latencies.append(time.monotonic() - start)
+        # meta中剩余ETag/Last-Modified,随缓存保存
+        stats.bytes += meta.pop("bytes", 0)
+        if data is None:
+            # 304 Not Modified
+            data = cached["data"]
+        now = time.time()
+        schedule.observe(data, now)
+        self.cache[cache_key] = {"time": now, "ttl": ttl, "data": data, "validators": meta}
+        if self._store is not None:
+            self._store.async_delay_save(self._data_to_save, CACHE_SAVE_DELAY)
+        return data
+
+    async def _async_attempt(
+        self, key: tuple[str, str, str], api_key: str, url: str, meta: dict, object_hook, timeout: float
+    ) -> dict | None:
+        if not (self._hedge or self._hedge_owners):
+            return await HeWeather._async_get_data(self._session, url, meta, object_hook, timeout)
+
+        # 各请求使用meta的副本,采用的响应再写回
+        metas: dict[asyncio.Future, dict] = {}
+
+        def start() -> asyncio.Future:
+            task_meta = dict(meta)
+            task = asyncio.ensure_future(
+                HeWeather._async_get_data(self._session, url, task_meta, object_hook, timeout)
+            )
+            metas[task] = task_meta
+            return task
+
+        pending = {start()}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self._hedge_delay(key))
+            # 对冲请求同样需要令牌,无令牌可用时不对冲,继续等待第一个请求
+            if not done and self._bucket(api_key).try_acquire():
+                self._stats[key].hedges += 1
+                self._record_usage(api_key, time.time())
+                pending.add(start())
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        meta.update(metas[task])
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _hedge_delay(self, key: tuple[str, str, str]) -> float:
+        latencies = self._stats[key].latencies
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return ATTEMPT_TIMEOUT / 2
+        return max(_percentile(sorted(latencies), 0.95), HEDGE_MIN_DELAY)
+
+    def _data_to_save(self) -> dict[str, dict]:
+        self.cache = self._prune(self.cache)
+        return self.cache
+
+    def _async_request_done(self, key: tuple[str, str, str], task: asyncio.Future) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            # 标记异常已读取,避免所有订阅者都已取消时产生告警
+            task.exception()
+
 
 class ConnectError(Exception):
     """Raised when Http connect in error."""
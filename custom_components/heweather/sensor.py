@@ -0,0 +1,442 @@
+"""Support for HeWeather sensors."""
+from __future__ import annotations
+
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import timedelta
+
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorEntityDescription,
+    SensorStateClass,
+)
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import (
+    CONF_LOCATION,
+    CONF_NAME,
+    CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
+    DEGREE,
+    LENGTH_KILOMETERS,
+    LENGTH_MILLIMETERS,
+    PERCENTAGE,
+    PRESSURE_HPA,
+    SPEED_KILOMETERS_PER_HOUR,
+    TEMP_CELSIUS,
+    TIME_MILLISECONDS,
+)
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.device_registry import DeviceEntryType
+from homeassistant.helpers.entity import DeviceInfo, EntityCategory
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.typing import StateType
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+
+from . import HeWeatherDataUpdateCoordinator
+from .heweather import NowcastBuffer, WarningTracker, ObservationHistory
+from .const import (
+    DOMAIN,
+    DEFAULT_NAME,
+    ATTRIBUTION,
+    HEWEATHER_TEMPERATURE,
+    HEWEATHER_APPARENT_TEMPERATURE,
+    HEWEATHER_DEW_POINT,
+    HEWEATHER_HUMIDITY,
+    HEWEATHER_PRESSURE,
+    HEWEATHER_CLOUD,
+    HEWEATHER_VISIBILITY,
+    HEWEATHER_WIND_SPEED,
+    HEWEATHER_WIND_BEARING,
+    HEWEATHER_CONDITION,
+    HEWEATHER_AQI,
+    HEWEATHER_PM25,
+    HEWEATHER_OZONE,
+    HEWEATHER_NOWCAST,
+    HEWEATHER_WARNING,
+)
+
+# 请求统计传感器的刷新间隔;数据未变化时协调器不通知实体,统计需单独刷新
+DIAGNOSTIC_INTERVAL = timedelta(minutes=1)
+
+SENSOR_TYPES: tuple[SensorEntityDescription, ...] = (
+    SensorEntityDescription(
+        key=HEWEATHER_TEMPERATURE,
+        name="Temperature",
+        device_class=SensorDeviceClass.TEMPERATURE,
+        native_unit_of_measurement=TEMP_CELSIUS,
+        state_class=SensorStateClass.MEASUREMENT,
+    ),
+    SensorEntityDescription(
+        key=HEWEATHER_APPARENT_TEMPERATURE,
+        name="Feels like",
+        device_class=SensorDeviceClass.TEMPERATURE,
+        native_unit_of_measurement=TEMP_CELSIUS,
+        state_class=SensorStateClass.MEASUREMENT,
+    ),
+    SensorEntityDescription(
+        key=HEWEATHER_DEW_POINT,
+        name="Dew point",
+        device_class=SensorDeviceClass.TEMPERATURE,
+        native_unit_of_measurement=TEMP_CELSIUS,
+        state_class=SensorStateClass.MEASUREMENT,
+        entity_registry_enabled_default=False,
+    ),
+    SensorEntityDescription(
+        key=HEWEATHER_HUMIDITY,
+        name="Humidity",
+        device_class=SensorDeviceClass.HUMIDITY,
+        native_unit_of_measurement=PERCENTAGE,
+        state_class=SensorStateClass.MEASUREMENT,
+    ),
+    SensorEntityDescription(
+        key=HEWEATHER_PRESSURE,
+        name="Pressure",
+        device_class=SensorDeviceClass.PRESSURE,
+        native_unit_of_measurement=PRESSURE_HPA,
+        state_class=SensorStateClass.MEASUREMENT,
+        entity_registry_enabled_default=False,
+    ),
+    SensorEntityDescription(
+        key=HEWEATHER_CLOUD,
+        name="Cloud coverage",
+        icon="mdi:weather-cloudy",
+        native_unit_of_measurement=PERCENTAGE,
+        state_class=SensorStateClass.MEASUREMENT,
+        entity_registry_enabled_default=False,
+    ),
+    SensorEntityDescription(
+        key=HEWEATHER_VISIBILITY,
+        name="Visibility",
+        icon="mdi:eye",
+        native_unit_of_measurement=LENGTH_KILOMETERS,
+        state_class=SensorStateClass.MEASUREMENT,
+        entity_registry_enabled_default=False,
+    ),
+    SensorEntityDescription(
+        key=HEWEATHER_WIND_SPEED,
+        name="Wind speed",
+        icon="mdi:weather-windy",
+        native_unit_of_measurement=SPEED_KILOMETERS_PER_HOUR,
+        state_class=SensorStateClass.MEASUREMENT,
+    ),
+    SensorEntityDescription(
+        key=HEWEATHER_WIND_BEARING,
+        name="Wind bearing",
+        icon="mdi:compass-outline",
+        native_unit_of_measurement=DEGREE,
+        entity_registry_enabled_default=False,
+    ),
+    SensorEntityDescription(
+        key=HEWEATHER_CONDITION,
+        name="Condition",
+        icon="mdi:weather-partly-cloudy",
+    ),
+    SensorEntityDescription(
+        key=HEWEATHER_AQI,
+        name="AQI",
+        device_class=SensorDeviceClass.AQI,
+        state_class=SensorStateClass.MEASUREMENT,
+    ),
+    SensorEntityDescription(
+        key=HEWEATHER_PM25,
+        name="PM2.5",
+        device_class=SensorDeviceClass.PM25,
+        native_unit_of_measurement=CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
+        state_class=SensorStateClass.MEASUREMENT,
+    ),
+    SensorEntityDescription(
+        key=HEWEATHER_OZONE,
+        name="Ozone",
+        device_class=SensorDeviceClass.OZONE,
+        native_unit_of_measurement=CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
+        state_class=SensorStateClass.MEASUREMENT,
+    ),
+)
+
+
+NOWCAST_SENSOR_TYPE = SensorEntityDescription(
+    key=HEWEATHER_NOWCAST,
+    name="Precipitation nowcast",
+    icon="mdi:weather-pouring",
+    native_unit_of_measurement=LENGTH_MILLIMETERS,
+)
+
+WARNING_SENSOR_TYPE = SensorEntityDescription(
+    key=HEWEATHER_WARNING,
+    name="Weather warnings",
+    icon="mdi:alert",
+)
+
+
+@dataclass
+class HeWeatherDiagnosticSensorEntityDescription(SensorEntityDescription):
+    """Describes a sensor computed from the request statistics."""
+
+    value_fn: Callable[[dict], StateType] = lambda diagnostics: None
+
+
+def _latency_p95(diagnostics: dict) -> StateType:
+    latencies = [
+        stats["latency_p95"]
+        for stats in diagnostics["endpoints"].values()
+        if stats["latency_p95"] is not None
+    ]
+    return round(max(latencies) * 1000) if latencies else None
+
+
+@dataclass
+class HeWeatherHistorySensorEntityDescription(SensorEntityDescription):
+    """Describes a sensor of a rolling aggregate of the observation history."""
+
+    span: int = 24 * 3600
+    field: str = ""
+
+
+HISTORY_SENSOR_TYPES: tuple[HeWeatherHistorySensorEntityDescription, ...] = (
+    HeWeatherHistorySensorEntityDescription(
+        key="temperature_max_24h",
+        name="Temperature max (24h)",
+        device_class=SensorDeviceClass.TEMPERATURE,
+        native_unit_of_measurement=TEMP_CELSIUS,
+        field="temperature_max",
+    ),
+    HeWeatherHistorySensorEntityDescription(
+        key="temperature_min_24h",
+        name="Temperature min (24h)",
+        device_class=SensorDeviceClass.TEMPERATURE,
+        native_unit_of_measurement=TEMP_CELSIUS,
+        field="temperature_min",
+    ),
+    HeWeatherHistorySensorEntityDescription(
+        key="temperature_mean_24h",
+        name="Temperature mean (24h)",
+        device_class=SensorDeviceClass.TEMPERATURE,
+        native_unit_of_measurement=TEMP_CELSIUS,
+        entity_registry_enabled_default=False,
+        field="temperature_mean",
+    ),
+    HeWeatherHistorySensorEntityDescription(
+        key="precipitation_3h",
+        name="Precipitation (3h)",
+        icon="mdi:weather-rainy",
+        native_unit_of_measurement=LENGTH_MILLIMETERS,
+        span=3 * 3600,
+        field="precipitation",
+    ),
+    HeWeatherHistorySensorEntityDescription(
+        key="precipitation_24h",
+        name="Precipitation (24h)",
+        icon="mdi:weather-rainy",
+        native_unit_of_measurement=LENGTH_MILLIMETERS,
+        field="precipitation",
+    ),
+)
+
+
+DIAGNOSTIC_SENSOR_TYPES: tuple[HeWeatherDiagnosticSensorEntityDescription, ...] = (
+    HeWeatherDiagnosticSensorEntityDescription(
+        key="api_requests",
+        name="API requests (24h)",
+        icon="mdi:counter",
+        entity_category=EntityCategory.DIAGNOSTIC,
+        entity_registry_enabled_default=False,
+        value_fn=lambda diagnostics: diagnostics["quota"]["used"],
+    ),
+    HeWeatherDiagnosticSensorEntityDescription(
+        key="latency_p95",
+        name="API latency p95",
+        icon="mdi:timer-outline",
+        native_unit_of_measurement=TIME_MILLISECONDS,
+        entity_category=EntityCategory.DIAGNOSTIC,
+        entity_registry_enabled_default=False,
+        value_fn=_latency_p95,
+    ),
+)
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    config_entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Add HeWeather sensors from a config_entry."""
+    coordinator: HeWeatherDataUpdateCoordinator = hass.data[DOMAIN][config_entry.entry_id]
+    entities: list[HeWeatherSensor] = [
+        HeWeatherSensor(
+            coordinator,
+            description,
+            config_entry.data[CONF_LOCATION],
+            config_entry.data[CONF_NAME],
+        )
+        for description in SENSOR_TYPES
+    ]
+    entities.extend(
+        HeWeatherDiagnosticSensor(
+            coordinator,
+            description,
+            config_entry.data[CONF_LOCATION],
+            config_entry.data[CONF_NAME],
+        )
+        for description in DIAGNOSTIC_SENSOR_TYPES
+    )
+    entities.extend(
+        HeWeatherHistorySensor(
+            coordinator,
+            description,
+            config_entry.data[CONF_LOCATION],
+            config_entry.data[CONF_NAME],
+        )
+        for description in HISTORY_SENSOR_TYPES
+    )
+    if coordinator.nowcast is not None:
+        entities.append(
+            HeWeatherNowcastSensor(
+                coordinator.nowcast,
+                NOWCAST_SENSOR_TYPE,
+                config_entry.data[CONF_LOCATION],
+                config_entry.data[CONF_NAME],
+            )
+        )
+    if coordinator.warning is not None:
+        entities.append(
+            HeWeatherWarningSensor(
+                coordinator.warning,
+                WARNING_SENSOR_TYPE,
+                config_entry.data[CONF_LOCATION],
+                config_entry.data[CONF_NAME],
+            )
+        )
+    async_add_entities(entities)
+
+
+class HeWeatherSensor(CoordinatorEntity[HeWeatherDataUpdateCoordinator], SensorEntity):
+    """Implementation of a HeWeather sensor."""
+
+    def __init__(
+        self,
+        coordinator: HeWeatherDataUpdateCoordinator,
+        description: SensorEntityDescription,
+        uid: str,
+        name: str,
+    ) -> None:
+        """Initialise the sensor."""
+        super().__init__(coordinator)
+        self.entity_description = description
+        self._attr_unique_id = f"{uid}_{description.key}"
+        self._attr_name = f"{name if name is not None else DEFAULT_NAME} {description.name}"
+        self._attr_attribution = ATTRIBUTION
+        # 上次写入的状态,未变化时不再写入
+        self._written: tuple | None = None
+
+    @property
+    def native_value(self) -> StateType:
+        """Return the state of the sensor."""
+        return self.coordinator.data.get(self.entity_description.key)
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Write the state only when the value of this sensor changed."""
+        written = (self.available, self.native_value, self.extra_state_attributes)
+        if written == self._written:
+            return
+        self._written = written
+        self.async_write_ha_state()
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Device info."""
+        return DeviceInfo(
+            default_name="Forecast",
+            entry_type=DeviceEntryType.SERVICE,
+            identifiers={(DOMAIN,)},  # type: ignore[arg-type]
+            manufacturer="HeWeather",
+            configuration_url="https://www.qweather.com/",
+        )
+
+
+class HeWeatherDiagnosticSensor(HeWeatherSensor):
+    """Sensor exposing the request statistics of a location."""
+
+    entity_description: HeWeatherDiagnosticSensorEntityDescription
+
+    async def async_added_to_hass(self) -> None:
+        """Also refresh the statistics on a timer."""
+        await super().async_added_to_hass()
+        self.async_on_remove(
+            async_track_time_interval(self.hass, self._async_refresh, DIAGNOSTIC_INTERVAL)
+        )
+
+    @callback
+    def _async_refresh(self, _now) -> None:
+        self._handle_coordinator_update()
+
+    @property
+    def native_value(self) -> StateType:
+        """Return the state of the sensor."""
+        return self.entity_description.value_fn(self.coordinator.weather.diagnostics())
+
+
+class HeWeatherHistorySensor(HeWeatherSensor):
+    """Sensor of a rolling aggregate of the observed weather."""
+
+    entity_description: HeWeatherHistorySensorEntityDescription
+
+    @property
+    def native_value(self) -> StateType:
+        """Return the state of the sensor."""
+        history: ObservationHistory = self.coordinator.weather.history
+        return history.aggregates(self.entity_description.span).get(self.entity_description.field)
+
+    @property
+    def extra_state_attributes(self) -> dict:
+        """Return the number of samples the aggregate is computed from."""
+        history: ObservationHistory = self.coordinator.weather.history
+        return {"samples": history.aggregates(self.entity_description.span)["samples"]}
+
+
+class HeWeatherNowcastSensor(HeWeatherSensor):
+    """Sensor of the precipitation expected in the next two hours."""
+
+    @property
+    def native_value(self) -> float | None:
+        """Return the state of the sensor."""
+        nowcast: NowcastBuffer = self.coordinator.data
+        return nowcast.precipitation()
+
+    @property
+    def extra_state_attributes(self) -> dict:
+        """Return the minutely forecast."""
+        nowcast: NowcastBuffer = self.coordinator.data
+        return {
+            "summary": nowcast.summary,
+            "minutes_to_precipitation": nowcast.minutes_to_precipitation(),
+            "minutely": nowcast.series(),
+        }
+
+
+class HeWeatherWarningSensor(HeWeatherSensor):
+    """Sensor of the number of active weather warnings."""
+
+    @property
+    def native_value(self) -> int:
+        """Return the state of the sensor."""
+        warnings: WarningTracker = self.coordinator.data
+        return len(warnings.warnings)
+
+    @property
+    def extra_state_attributes(self) -> dict:
+        """Return a summary of the active warnings, the details are in the events."""
+        warnings: WarningTracker = self.coordinator.data
+        return {
+            "warnings": [
+                {
+                    "id": warning["id"],
+                    "title": warning.get("title"),
+                    "severity": warning.get("severity") or warning.get("level"),
+                    "type_name": warning.get("typeName"),
+                    "end_time": warning.get("endTime"),
+                }
+                for warning in warnings.warnings.values()
+            ]
+        }
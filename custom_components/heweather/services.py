@@ -0,0 +1,178 @@
+"""Services to import and export HeWeather locations in bulk."""
+from __future__ import annotations
+
+import asyncio
+import csv
+import io
+import logging
+
+import voluptuous as vol
+
+from homeassistant.config_entries import SOURCE_IMPORT
+from homeassistant.const import CONF_API_KEY, CONF_LOCATION, CONF_NAME
+from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.exceptions import HomeAssistantError
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.util.yaml import load_yaml
+
+from .heweather import HeWeather, InvalidApiKeyError
+from .const import (
+    DOMAIN,
+    ATTR_FILE,
+    ATTR_LOCATIONS,
+    DEFAULT_EXPORT_FILE,
+    SERVICE_EXPORT_LOCATIONS,
+    SERVICE_IMPORT_LOCATIONS,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# 同时进行的地点查询数
+IMPORT_CONCURRENCY = 5
+# 导入的条目依次间隔该时间(秒)创建,首次刷新随之错开;同时创建的条目数不超过IMPORT_CONCURRENCY
+IMPORT_STAGGER = 2
+
+LOCATION_SCHEMA = vol.Any(
+    cv.string,
+    vol.Schema({vol.Required(CONF_LOCATION): cv.string, vol.Optional(CONF_NAME): cv.string}),
+)
+
+IMPORT_SCHEMA = vol.All(
+    vol.Schema(
+        {
+            vol.Optional(ATTR_LOCATIONS): vol.All(cv.ensure_list, [LOCATION_SCHEMA]),
+            vol.Optional(ATTR_FILE): cv.string,
+            vol.Optional(CONF_API_KEY): cv.string,
+        }
+    ),
+    cv.has_at_least_one_key(ATTR_LOCATIONS, ATTR_FILE),
+)
+
+EXPORT_SCHEMA = vol.Schema({vol.Optional(ATTR_FILE, default=DEFAULT_EXPORT_FILE): cv.string})
+
+
+def read_locations(path: str) -> list:
+    """Read locations from a YAML list or a CSV file of location,name rows."""
+    if path.endswith((".yaml", ".yml")):
+        return vol.All(cv.ensure_list, [LOCATION_SCHEMA])(load_yaml(path))
+    with open(path, encoding="utf-8", newline="") as file:
+        # 坐标含逗号,需加引号: "116.41,39.92",Home
+        return [
+            {CONF_LOCATION: row[0].strip(), CONF_NAME: row[1].strip()} if len(row) > 1 and row[1].strip()
+            else row[0].strip()
+            for row in csv.reader(file)
+            if row and row[0].strip() and row[0] != CONF_LOCATION
+        ]
+
+
+def format_locations(rows: list[tuple[str, str]]) -> str:
+    """Return locations as CSV text, readable by read_locations."""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow((CONF_LOCATION, CONF_NAME))
+    writer.writerows(rows)
+    return output.getvalue()
+
+
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Register the HeWeather services."""
+
+    async def async_import_locations(call: ServiceCall) -> None:
+        """Create an entry for each location that is not configured yet."""
+        items = list(call.data.get(ATTR_LOCATIONS, []))
+        if ATTR_FILE in call.data:
+            items += await hass.async_add_executor_job(read_locations, _allowed_path(hass, call.data[ATTR_FILE]))
+
+        entries = hass.config_entries.async_entries(DOMAIN)
+        api_key = call.data.get(CONF_API_KEY) or next(
+            (entry.data[CONF_API_KEY] for entry in entries), None
+        )
+        if api_key is None:
+            raise HomeAssistantError("An API key is required when no location is configured")
+
+        # 批量并发查询地点,并发数受限
+        session = async_get_clientsession(hass)
+        semaphore = asyncio.Semaphore(IMPORT_CONCURRENCY)
+
+        async def async_resolve(item) -> tuple[str, str] | None:
+            if isinstance(item, str):
+                item = {CONF_LOCATION: item}
+            location = item[CONF_LOCATION]
+            # 已给出名称的LocationID无需查询
+            if location.isdigit() and CONF_NAME in item:
+                return location, item[CONF_NAME]
+            async with semaphore:
+                try:
+                    cities = await HeWeather.async_get_location(session, location, api_key)
+                except InvalidApiKeyError:
+                    raise
+                except Exception as err:
+                    _LOGGER.warning("Cannot import location %s: %r", location, err)
+                    return None
+            if not cities:
+                _LOGGER.warning("Location %s was not found", location)
+                return None
+            city_id, label = next(iter(cities.items()))
+            return city_id, item.get(CONF_NAME) or label.split("-")[0]
+
+        try:
+            resolved = await asyncio.gather(*(async_resolve(item) for item in items))
+        except InvalidApiKeyError as err:
+            raise HomeAssistantError("Invalid API key") from err
+
+        configured = {entry.unique_id for entry in entries}
+        locations: dict[str, str] = {}
+        for result in resolved:
+            if result is not None and result[0] not in configured:
+                locations.setdefault(*result)
+        _LOGGER.info("Importing %s of %s locations", len(locations), len(items))
+        if locations:
+            # 条目在后台逐个错开创建,不阻塞服务调用
+            hass.async_create_task(_async_create_entries(hass, api_key, locations))
+
+    async def async_export_locations(call: ServiceCall) -> None:
+        """Write the configured locations to a CSV file."""
+        file = call.data[ATTR_FILE]
+        # 默认文件由本集成写入配置目录,不受allowlist_external_dirs限制
+        path = hass.config.path(file) if file == DEFAULT_EXPORT_FILE else _allowed_path(hass, file)
+        text = format_locations(
+            [
+                (entry.data[CONF_LOCATION], entry.title)
+                for entry in hass.config_entries.async_entries(DOMAIN)
+            ]
+        )
+        await hass.async_add_executor_job(_write_file, path, text)
+
+    hass.services.async_register(DOMAIN, SERVICE_IMPORT_LOCATIONS, async_import_locations, schema=IMPORT_SCHEMA)
+    hass.services.async_register(DOMAIN, SERVICE_EXPORT_LOCATIONS, async_export_locations, schema=EXPORT_SCHEMA)
+
+
+async def _async_create_entries(hass: HomeAssistant, api_key: str, locations: dict[str, str]) -> None:
+    semaphore = asyncio.Semaphore(IMPORT_CONCURRENCY)
+
+    async def async_create(index: int, location: str, name: str) -> None:
+        await asyncio.sleep(index * IMPORT_STAGGER)
+        # 条目创建时即完成首次刷新,限制同时进行的数量
+        async with semaphore:
+            await hass.config_entries.flow.async_init(
+                DOMAIN,
+                context={"source": SOURCE_IMPORT},
+                data={CONF_API_KEY: api_key, CONF_LOCATION: location, CONF_NAME: name},
+            )
+
+    await asyncio.gather(
+        *(async_create(index, location, name) for index, (location, name) in enumerate(locations.items()))
+    )
+
+
+def _allowed_path(hass: HomeAssistant, file: str) -> str:
+    path = hass.config.path(file)
+    if not hass.config.is_allowed_path(path):
+        raise HomeAssistantError(f"Cannot access {file}, add it to allowlist_external_dirs")
+    return path
+
+
+def _write_file(path: str, text: str) -> None:
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        file.write(text)
@@ -15,6 +15,7 @@ from homeassistant.components.weather import (
     ATTR_FORECAST,
     ATTR_FORECAST_CONDITION,
     ATTR_WEATHER_HUMIDITY,
+    ATTR_WEATHER_OZONE,
     ATTR_WEATHER_PRESSURE,
     ATTR_WEATHER_TEMPERATURE,
     ATTR_WEATHER_WIND_BEARING,
@@ -38,10 +39,14 @@ from homeassistant.const import (
 )
 
 from . import HeWeatherDataUpdateCoordinator
+from .heweather import ForecastSeries
 from .const import (
     DOMAIN,
     DEFAULT_NAME,
-    ATTRIBUTION
+    ATTRIBUTION,
+    CONF_FORECAST_WINDOW,
+    HEWEATHER_FORECAST_HOURLY,
+    HEWEATHER_HISTORY,
 )
 
 
@@ -59,7 +64,8 @@ async def async_setup_entry(
                 coordinator, 
                 config_entry.data[CONF_LOCATION], 
                 config_entry.data[CONF_NAME], 
-                hass.config.units.is_metric
+                hass.config.units.is_metric,
+                config_entry.options.get(CONF_FORECAST_WINDOW, 0),
             )
         ]
     )
@@ -74,6 +80,7 @@ class HeWeatherEntity(CoordinatorEntity[HeWeatherDataUpdateCoordinator], Weather
         uid: str,
         name: str,
         is_metric: bool,
+        window: int = 0,
     ) -> None:
         """Initialise the platform with a data instance and site."""
         super().__init__(coordinator)
@@ -90,6 +97,9 @@ class HeWeatherEntity(CoordinatorEntity[HeWeatherDataUpdateCoordinator], Weather
 
         self._is_metric = is_metric
 
+        # 预报只输出从当前时段起的window条,0为全部
+        self._window = window
+
     # 天气状态
     @property
     def condition(self) -> str | None:
@@ -127,6 +137,12 @@ class HeWeatherEntity(CoordinatorEntity[HeWeatherDataUpdateCoordinator], Weather
         """Return the wind direction."""
         return self.coordinator.data.get(ATTR_WEATHER_WIND_BEARING)
 
+    # 臭氧
+    @property
+    def ozone(self) -> float | None:
+        """Return the ozone level."""
+        return self.coordinator.data.get(ATTR_WEATHER_OZONE)
+
     # 可见度
     @property
     def visibility(self) -> float:
@@ -137,7 +153,23 @@ class HeWeatherEntity(CoordinatorEntity[HeWeatherDataUpdateCoordinator], Weather
     @property
     def forecast(self) -> list[Forecast] | None:
         """Return the forecast array."""
-        return self.coordinator.data[ATTR_FORECAST]
+        series: ForecastSeries | None = self.coordinator.data.get(ATTR_FORECAST)
+        return None if series is None else series.window(self._window)
+
+    # 观测历史的滚动统计,及额外的逐小时预报
+    @property
+    def extra_state_attributes(self) -> dict:
+        """Return the observation aggregates and the hourly forecast when it is configured."""
+        history = self.coordinator.weather.history
+        attributes = {
+            HEWEATHER_HISTORY: {
+                f"{span // 3600}h": history.aggregates(span) for span in history.windows
+            }
+        }
+        series: ForecastSeries | None = self.coordinator.data.get(HEWEATHER_FORECAST_HOURLY)
+        if series is not None:
+            attributes[HEWEATHER_FORECAST_HOURLY] = series.window(self._window)
+        return attributes
 
     @property
     def device_info(self) -> DeviceInfo: